@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of the callback functions of overlapping_wildcard_error.py, on synthetic
+projects of N variables, M values per variable and P presets per variable.
+
+The callback bodies are called directly, unwrapped from Dash, with a stub
+callback_context, so that only the Python work of each callback is measured. For every
+case, the median wall time per call and the peak memory allocated per call (tracemalloc)
+are reported, plus the serialized layout size for initiate_a_demo.
+
+    python benchmark_callbacks.py --variables 20 --values 1000 --presets 10
+    python benchmark_callbacks.py ... --save-baseline   # store the results as the baseline
+    python benchmark_callbacks.py ...                   # exit 1 on a regression against it
+
+Baselines are stored per (N, M, P) and are only comparable on the machine that made them.
+"""
+
+import argparse
+import inspect
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import overlapping_wildcard_error as app_module
+
+
+###############################################################################
+# 1. Synthetic projects
+###############################################################################
+
+def synthetic_definition(n_variables, n_values, n_presets, seed = 0):
+    """
+    Return a filter menu definition, as project_definition() does, of n_variables
+    variables, half dropdown and half rangeslider variables, each with 'All' and
+    n_presets presets over n_values values.
+    """
+    rng = random.Random(seed)
+    n_dropdowns = (n_variables + 1) // 2
+
+    dropdowns = {}
+    for v in range(n_dropdowns):
+        values = [f"D{v}-{i}" for i in range(n_values)]
+        dropdowns[f"Dropdown {v}"] = {
+            'All' : values,
+            **{f"Preset {p}" : rng.sample(values, rng.randint(1, n_values))
+               for p in range(n_presets)}
+            }
+
+    rangesliders = {}
+    for v in range(n_variables - n_dropdowns):
+        presets = {}
+        for p in range(n_presets):
+            x1 = rng.randint(1, n_values)
+            presets[f"Preset {p}"] = [x1, rng.randint(x1, n_values)]
+        rangesliders[f"Rangeslider {v}"] = {'All' : [1, n_values], **presets}
+
+    return {'D' : dropdowns, 'R' : rangesliders}
+
+
+def stub_context(trigger_id, triggered_value = None, **args_grouping):
+    """Return a stand-in for dash.callback_context, for a single triggering input."""
+    return SimpleNamespace(
+        triggered_prop_ids = {'trigger.value' : trigger_id},
+        triggered = [{'prop_id' : 'trigger.value', 'value' : triggered_value}],
+        args_grouping = SimpleNamespace(**args_grouping),
+        inputs_list = [],
+        states_list = []
+        )
+
+
+def body(func):
+    """Return the Python function underneath Dash's (and callback()'s) wrappers."""
+    return inspect.unwrap(func)
+
+
+###############################################################################
+# 2. Cases
+###############################################################################
+
+def cases(definition):
+    """
+    Return {case name: (setup, call)}. setup() prepares the module state of one call,
+    call() makes it; only call() is measured. Every sync and markdown case also has a 
+    cold variant, whose setup clears SYNC_DICT_CACHE.
+    """
+    store_data = json.dumps({**definition['D'], **definition['R']})
+    dropdown_variable, radioitem2dropdownvalues_dict = list(definition['D'].items())[-1]
+    rangeslider_variable, radioitem2rangeslidervalues_dict = list(definition['R'].items())[-1]
+    last_dropdown_preset = list(radioitem2dropdownvalues_dict)[-1]
+    last_rangeslider_preset = list(radioitem2rangeslidervalues_dict)[-1]
+    # worst case for the preset scans: a selection matching no preset
+    custom_dropdown_value = radioitem2dropdownvalues_dict['All'][:-1][::-1]
+    custom_rangeslider_value = [radioitem2rangeslidervalues_dict['All'][0] + 1,
+                                radioitem2rangeslidervalues_dict['All'][1]]
+
+    def trigger(form_class, subcomponent, variable):
+        return {'component' : form_class.__name__, 'subcomponent' : subcomponent,
+                'A_or_B' : 'A', 'variable' : variable}
+
+    def with_context(ctx):
+        def setup():
+            app_module.callback_context = ctx
+        return setup
+
+    dropdown_class = app_module.FormWithRadioitemsAndDropdown
+    rangeslider_class = app_module.FormWithRadioitemsAndRangeslider
+
+    def cold_project():
+        app_module.PROJECT_CACHE.clear()
+        app_module.LAYOUT_CACHE.clear()
+
+    def cold(name, setup):
+        # the same call, with the sync dicts parsed again rather than found in SYNC_DICT_CACHE
+        def cold_setup():
+            app_module.SYNC_DICT_CACHE.clear()
+            setup()
+        cold_name = name[:-1] + ', cold]' if name.endswith(']') else name + '[cold]'
+        return cold_name, cold_setup
+
+    callbacks = {
+        'sync_radioitems_and_dropdown[radioitems]' : (
+            with_context(stub_context(trigger(dropdown_class, 'radioitems', dropdown_variable))),
+            lambda: body(dropdown_class.sync_radioitems_and_dropdown)(
+                last_dropdown_preset, None, store_data)
+            ),
+        'sync_radioitems_and_dropdown[dropdown]' : (
+            with_context(stub_context(trigger(dropdown_class, 'dropdown', dropdown_variable))),
+            lambda: body(dropdown_class.sync_radioitems_and_dropdown)(
+                None, custom_dropdown_value, store_data)
+            ),
+        'sync_radioitems_and_rangelsider[radioitems]' : (
+            with_context(stub_context(trigger(rangeslider_class, 'radioitems', rangeslider_variable))),
+            lambda: body(rangeslider_class.sync_radioitems_and_rangelsider)(
+                last_rangeslider_preset, None, store_data)
+            ),
+        'sync_radioitems_and_rangelsider[rangeslider]' : (
+            with_context(stub_context(trigger(rangeslider_class, 'rangeslider', rangeslider_variable))),
+            lambda: body(rangeslider_class.sync_radioitems_and_rangelsider)(
+                None, custom_rangeslider_value, store_data)
+            ),
+        'FormWithRadioitemsAndDropdown.markdown_children_update' : (
+            with_context(stub_context(
+                trigger(dropdown_class, 'dropdown', dropdown_variable), custom_dropdown_value,
+                store_data = {'value' : store_data}, not_audience_A = {'value' : True})),
+            lambda: body(dropdown_class.markdown_children_update)(None, None, None)
+            ),
+        'FormWithRadioitemsAndRangeslider.markdown_children_update' : (
+            with_context(stub_context(
+                trigger(rangeslider_class, 'rangeslider', rangeslider_variable), custom_rangeslider_value,
+                store_data = {'value' : store_data}, not_audience_A = {'value' : True})),
+            lambda: body(rangeslider_class.markdown_children_update)(None, None, None)
+            )
+        }
+    for name, (setup, call) in list(callbacks.items()):
+        cold_name, cold_setup = cold(name, setup)
+        callbacks[cold_name] = (cold_setup, call)
+
+    return {
+        **callbacks,
+        'initiate_a_demo[cold]' : (
+            cold_project,
+            lambda: body(app_module.initiate_a_demo)('Benchmark')
+            ),
+        'initiate_a_demo[cached]' : (
+            lambda: None,
+            lambda: body(app_module.initiate_a_demo)('Benchmark')
+            )
+        }
+
+
+###############################################################################
+# 3. Measurement
+###############################################################################
+
+def measure(setup, call, repeat):
+    """Return {'seconds': median wall time per call, 'peak_bytes': peak allocation per call}."""
+    setup()
+    call() # warm up
+
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+
+    setup()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds' : statistics.median(timings), 'peak_bytes' : peak_bytes}
+
+
+def run(n_variables, n_values, n_presets, repeat):
+    definition = synthetic_definition(n_variables, n_values, n_presets)
+    app_module.project_definition = lambda selected_project: definition
+    app_module.SYNC_DICT_CACHE.clear()
+
+    results = {
+        name : measure(setup, call, repeat)
+        for name, (setup, call) in cases(definition).items()
+        }
+    layout = body(app_module.initiate_a_demo)('Benchmark')[:4]
+    results['initiate_a_demo[cold]']['layout_bytes'] = len(json.dumps(layout))
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Return a line per measurement of results that exceeds baseline by more than tolerance."""
+    lines = []
+    for name, measurements in results.items():
+        for metric, value in measurements.items():
+            reference = baseline.get(name, {}).get(metric)
+            if reference and value > reference * (1 + tolerance):
+                lines.append(f"{name} {metric}: {value:.6g} > {reference:.6g} (+{tolerance:.0%})")
+    return lines
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--variables', type = int, default = 10, help = "N, number of variables")
+    parser.add_argument('--values', type = int, default = 1000, help = "M, values per variable")
+    parser.add_argument('--presets', type = int, default = 10, help = "P, presets per variable")
+    parser.add_argument('--repeat', type = int, default = 50, help = "timed calls per case")
+    parser.add_argument('--baseline', default = 'benchmark_baseline.json',
+                        help = "path of the stored baselines")
+    parser.add_argument('--save-baseline', action = 'store_true',
+                        help = "store the results as the baseline of N, M, P")
+    parser.add_argument('--tolerance', type = float, default = 0.25,
+                        help = "relative increase over the baseline counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.variables, args.values, args.presets, args.repeat)
+
+    print(f"N={args.variables} M={args.values} P={args.presets}")
+    for name, measurements in results.items():
+        line = f"{name:<60} {measurements['seconds'] * 1e6:>12,.1f} us {measurements['peak_bytes']:>14,} B peak"
+        if 'layout_bytes' in measurements:
+            line += f" {measurements['layout_bytes']:>14,} B layout"
+        print(line)
+
+    scale = f"{args.variables}x{args.values}x{args.presets}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[scale] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent = 2)
+        print(f"Saved baseline {scale} to {args.baseline}")
+        return 0
+
+    if scale not in baselines:
+        print(f"No baseline {scale} in {args.baseline}; run with --save-baseline to store one.")
+        return 0
+
+    failures = regressions(results, baselines[scale], args.tolerance)
+    for line in failures:
+        print("REGRESSION", line)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+"""
+Load generator for overlapping_wildcard_error.py: replays interaction traces of many
+simulated users concurrently against /_dash-update-component and reports throughput and
+latency percentiles per callback.
+
+Each simulated user holds a model of the browser's components, built from /_dash-layout
+and the callback responses, and fires every server-side callback whose inputs a user
+interaction changes, then the callbacks chained on the props those responses change, as
+the Dash renderer does. Clientside callbacks are not run; their effects are part of the
+interactions, which the traces list as the prop changes the browser would make.
+
+    python loadtest.py --users 50 --interactions 200               # against a local app
+    python loadtest.py --url http://host:8050 --users 200          # against a running app
+    python loadtest.py --record traces.json --users 10             # store synthesized traces
+    python loadtest.py --traces traces.json                        # replay stored traces
+
+Traces are synthesized from the module's modes and project definitions, so run the load
+generator with the same module as the app under test. Background callbacks are sent but
+their results are not polled for.
+"""
+
+import argparse
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import dash._callback
+
+import overlapping_wildcard_error as app_module
+
+
+###############################################################################
+# 1. Dash protocol
+###############################################################################
+
+def stringify_id(id_):
+    """Return id_ as the Dash renderer writes it in prop ids and responses."""
+    if isinstance(id_, dict):
+        return json.dumps(id_, sort_keys = True, separators = (',', ':'))
+    return id_
+
+
+def parse_id(id_string):
+    return json.loads(id_string) if id_string.startswith('{') else id_string
+
+
+def parse_outputs(output):
+    """Return [(id, property), ...] of the output string of a callback in /_dash-dependencies."""
+    parts = output[2:-2].split('...') if output.startswith('..') else [output]
+    return [
+        (parse_id(part[:part.rindex('.')]), part[part.rindex('.') + 1:])
+        for part in parts
+        ]
+
+
+def is_wildcard(value):
+    return isinstance(value, list) and len(value) == 1 and value[0] in ('ALL', 'MATCH', 'ALLSMALLER')
+
+
+def matches(pattern, id_, match_values = None):
+    """Return whether the concrete id_ matches the (possibly wildcard) pattern id."""
+    if not isinstance(pattern, dict):
+        return pattern == id_
+    if not isinstance(id_, dict) or pattern.keys() != id_.keys():
+        return False
+    for key, value in pattern.items():
+        if is_wildcard(value):
+            if value == ['MATCH'] and match_values is not None and key in match_values \
+                    and match_values[key] != id_[key]:
+                return False
+        elif value != id_[key]:
+            return False
+    return True
+
+
+def overlaps(pattern, match_values, other, other_match_values):
+    """
+    Return whether some id could match both pattern and other, whose MATCH keys take
+    match_values and other_match_values.
+    """
+    if not isinstance(pattern, dict) or not isinstance(other, dict):
+        return pattern == other
+    if pattern.keys() != other.keys():
+        return False
+    for key in pattern:
+        values = []
+        for value, values_of_match in [(pattern[key], match_values), (other[key], other_match_values)]:
+            if value == ['MATCH']:
+                value = values_of_match.get(key, value)
+            values.append(value)
+        if not any(is_wildcard(value) for value in values) and values[0] != values[1]:
+            return False
+    return True
+
+
+class Callback:
+
+    def __init__(self, dependency, name):
+        """
+        A server-side callback as listed in /_dash-dependencies.
+
+        - dependency: dictionary, the entry of the callback in /_dash-dependencies.
+        - name: string, the name under which its latencies are reported.
+        """
+        self.output = dependency['output']
+        self.outputs = parse_outputs(self.output)
+        self.multi = self.output.startswith('..')
+        self.inputs = [(parse_id(x['id']), x['property']) for x in dependency['inputs']]
+        self.state = [(parse_id(x['id']), x['property']) for x in dependency.get('state', [])]
+        self.name = name
+
+    def feeds(self, match_values, other, other_match_values):
+        """Return whether an output of this callback may be an input of other."""
+        return any(
+            prop == other_prop and overlaps(pattern, match_values, other_pattern, other_match_values)
+            for pattern, prop in self.outputs
+            for other_pattern, other_prop in other.inputs
+            )
+
+    def triggered_by(self, changes):
+        """
+        Return {MATCH values: [(id, property), ...]} of the changes that are inputs of this
+        callback, grouped by the values of their MATCH keys, one group per request.
+        """
+        groups = {}
+        for id_, prop in changes:
+            for pattern, p in self.inputs:
+                if prop == p and matches(pattern, id_):
+                    key = tuple(sorted(
+                        (k, id_[k]) for k, v in pattern.items() if v == ['MATCH']
+                        )) if isinstance(pattern, dict) else ()
+                    groups.setdefault(key, []).append((id_, prop))
+                    break
+        return groups
+
+
+def callback_names():
+    """
+    Return {output string: qualified function name} of the callbacks of app_module. They
+    are registered with dash.callback, so they are found in Dash's global callback map
+    rather than in app.callback_map, which only holds those of app.callback.
+    """
+    names = {}
+    for output, entry in {**dash._callback.GLOBAL_CALLBACK_MAP, **app_module.app.callback_map}.items():
+        func = entry.get('callback')
+        while hasattr(func, '__wrapped__'):
+            func = func.__wrapped__
+        names[output] = getattr(func, '__qualname__', output)
+    return names
+
+
+###############################################################################
+# 2. Simulated browser
+###############################################################################
+
+class Browser:
+
+    def __init__(self, url, callbacks, stats):
+        """
+        One simulated user: a connection to the app and a model of its components, as
+        {stringified id: {property: value}}.
+        """
+        split = urlsplit(url)
+        self.connection = http.client.HTTPConnection(split.hostname, split.port or 80, timeout = 60)
+        self.callbacks = callbacks
+        self.stats = stats
+        self.components = {}
+        self.ids = {}
+        self.register(self.request('GET', '/_dash-layout')[1])
+
+    def request(self, method, path, body = None):
+        headers = {'Content-Type' : 'application/json'} if body is not None else {}
+        data = json.dumps(body).encode() if body is not None else None
+        start = time.perf_counter()
+        self.connection.request(method, path, data, headers)
+        response = self.connection.getresponse()
+        payload = response.read()
+        seconds = time.perf_counter() - start
+        return response.status, (json.loads(payload) if payload else None), seconds
+
+    def register(self, node):
+        """Add every component in node, a serialized layout, to the model."""
+        if isinstance(node, list):
+            for x in node:
+                self.register(x)
+        elif isinstance(node, dict):
+            props = node.get('props')
+            if isinstance(props, dict):
+                if 'id' in props:
+                    key = stringify_id(props['id'])
+                    self.ids[key] = props['id']
+                    self.components[key] = dict(props)
+                for value in props.values():
+                    self.register(value)
+
+    def value(self, id_, prop):
+        return self.components.get(stringify_id(id_), {}).get(prop)
+
+    def set(self, id_, prop, value):
+        key = stringify_id(id_)
+        self.ids.setdefault(key, id_)
+        self.components.setdefault(key, {})[prop] = value
+        if prop == 'children':
+            self.register(value)
+
+    def resolve(self, pattern, prop, match_values):
+        """Return the {id, property, value} dict(s) a callback receives for pattern.prop."""
+        if not isinstance(pattern, dict):
+            return {'id' : pattern, 'property' : prop, 'value' : self.value(pattern, prop)}
+        found = [
+            {'id' : id_, 'property' : prop, 'value' : self.components[key].get(prop)}
+            for key, id_ in self.ids.items()
+            if matches(pattern, id_, match_values)
+            ]
+        if any(v == ['ALL'] or v == ['ALLSMALLER'] for v in pattern.values()):
+            return found
+        return found[0] if found else None
+
+    def fire(self, callback, match_values, triggers):
+        """
+        Send one request for callback, triggered by triggers, whose ids share match_values,
+        and return the props it changed, as [(id, property, callback), ...].
+        """
+        match_values = dict(match_values)
+        outputs = [self.resolve(pattern, prop, match_values) for pattern, prop in callback.outputs]
+        if any(x is None for x in outputs):
+            return []
+        outputs = [
+            [{'id' : x['id'], 'property' : x['property']} for x in output]
+            if isinstance(output, list) else {'id' : output['id'], 'property' : output['property']}
+            for output in outputs
+            ]
+        body = {
+            'output' : callback.output,
+            'outputs' : outputs if callback.multi else outputs[0],
+            'inputs' : [self.resolve(pattern, prop, match_values) for pattern, prop in callback.inputs],
+            'state' : [self.resolve(pattern, prop, match_values) for pattern, prop in callback.state],
+            'changedPropIds' : [f"{stringify_id(id_)}.{prop}" for id_, prop in triggers]
+            }
+        if any(x is None for x in body['inputs'] + body['state']):
+            return []
+
+        status, response, seconds = self.request('POST', '/_dash-update-component', body)
+        self.stats.record(callback.name, seconds, status < 400)
+        if status != 200 or not response:
+            return []
+
+        changes = []
+        for key, props in response.get('response', {}).items():
+            id_ = parse_id(key)
+            for prop, value in props.items():
+                if isinstance(value, dict) and '__dash_patch_update' in value:
+                    # patches are not applied to the model, but still trigger callbacks
+                    changes.append((id_, prop, callback))
+                    continue
+                self.set(id_, prop, value)
+                changes.append((id_, prop, callback))
+        return changes
+
+    def interact(self, interaction, max_depth = 8):
+        """
+        Apply the prop changes of interaction, then run the server callbacks they trigger,
+        in rounds, as dash-renderer does: a callback is not triggered by its own outputs, 
+        and waits while another pending callback may still write one of its inputs, so 
+        that it is sent once with all of its triggers.
+        """
+        start = time.perf_counter()
+        changes = []
+        for change in interaction['changes']:
+            self.set(change['id'], change['property'], change['value'])
+            changes.append((change['id'], change['property'], None))
+
+        pending = {} # (callback index, MATCH values) -> triggers
+        for _ in range(max_depth):
+            for i, callback in enumerate(self.callbacks):
+                triggered = callback.triggered_by(
+                    [(id_, prop) for id_, prop, source in changes if source is not callback])
+                for match_values, triggers in triggered.items():
+                    pending.setdefault((i, match_values), []).extend(triggers)
+            if not pending:
+                break
+
+            def blocked(key):
+                i, match_values = key
+                return any(
+                    j != i and self.callbacks[j].feeds(
+                        dict(other_match_values), self.callbacks[i], dict(match_values))
+                    for j, other_match_values in pending
+                    )
+            # circular dependencies across callbacks: fire everything rather than stall
+            ready = [key for key in pending if not blocked(key)] or list(pending)
+
+            changes = []
+            for key in ready:
+                i, match_values = key
+                changes += self.fire(self.callbacks[i], match_values, pending.pop(key))
+        self.stats.record(f"interaction:{interaction['name']}", time.perf_counter() - start, True)
+
+
+###############################################################################
+# 3. Traces
+###############################################################################
+
+def synthesize_trace(projects, n_interactions, rng):
+    """
+    Return a list of interactions of one user, each {'name': ..., 'changes': [{'id',
+    'property', 'value'}, ...]}, listing the prop changes the user and the clientside
+    callbacks of the current modes would make.
+    """
+    clientside_sync = app_module.CLIENTSIDE_SYNC_CALLBACKS and app_module.SYNC_STORE_MODE != 'registry'
+    trace = []
+    state = {'n_clicks' : {}, 'not_audience_A' : False}
+
+    def change(id_, prop, value):
+        return {'id' : id_, 'property' : prop, 'value' : value}
+
+    def switch_project():
+        project = rng.choice(projects)
+        state['project'] = project
+        state['definition'] = definition = app_module.project_definition(project)
+        state['sync_dicts'] = app_module.ProjectSyncDicts({**definition['D'], **definition['R']})
+        state['n_clicks'] = {}
+        state['not_audience_A'] = False
+        return 'project switch', [change('Dropdown-SelectedProject', 'value', project)]
+
+    def pick_form():
+        A_or_B = 'A' if state['not_audience_A'] else rng.choice(['A', 'B'])
+        variables = [*state['definition']['D'], *state['definition']['R']]
+        variable = rng.choice(variables)
+        if variable in state['definition']['R']:
+            return A_or_B, variable, app_module.FormWithRadioitemsAndRangeslider
+        return A_or_B, variable, app_module.dropdown_form_class(state['definition']['D'][variable])
+
+    def filter_state_delta(A_or_B, variable, form_class, value, preset):
+        if not app_module.FILTER_STATE_STORE:
+            return []
+        delta = dict(A_or_B = A_or_B, var_type = form_class.var_type, variable = variable,
+                     value = value, preset = preset)
+        return [change('Store-FilterStateDelta', 'data', [delta])]
+
+    def toggle_collapse():
+        A_or_B, variable, form_class = pick_form()
+        key = (A_or_B, variable)
+        n_clicks = state['n_clicks'][key] = state['n_clicks'].get(key, 0) + 1
+        changes = [change(form_class.ids.button(A_or_B, variable), 'n_clicks', n_clicks),
+                   change(form_class.ids.collapse(A_or_B, variable), 'is_open', n_clicks % 2 == 1)]
+        if app_module.LAZY_FILTER_MENUS and n_clicks == 1:
+            changes.append(change(form_class.ids.collapse_body_request(A_or_B, variable), 'data', True))
+        return 'collapse toggle', changes
+
+    def click_preset():
+        A_or_B, variable, form_class = pick_form()
+        sync_dicts = state['sync_dicts']
+        preset = rng.choice(list(sync_dicts[variable]))
+        changes = [change(form_class.ids.radioitems(A_or_B, variable), 'value', preset)]
+        if form_class is app_module.FormWithRadioitemsAndRangeslider:
+            value = sync_dicts[variable][preset]
+            if clientside_sync:
+                changes.append(change(form_class.ids.rangeslider(A_or_B, variable), 'value', value))
+        elif form_class is app_module.FormWithRadioitemsAndDropdown:
+            value = sync_dicts.dropdown_value(variable, sync_dicts[variable][preset])
+            if clientside_sync and not app_module.COMPACT_DROPDOWN_VALUES:
+                changes.append(change(form_class.ids.dropdown(A_or_B, variable), 'value', value))
+        else:
+            value = []
+        return 'preset click', changes + filter_state_delta(A_or_B, variable, form_class, value, preset)
+
+    def commit_slider():
+        A_or_B, variable, form_class = pick_form()
+        if form_class is not app_module.FormWithRadioitemsAndRangeslider:
+            return click_preset()
+        sync_dicts = state['sync_dicts']
+        x1, x2 = sync_dicts[variable]['All']
+        step = form_class.step([x1, x2])
+        value = sorted(rng.randrange(x1, x2 + 1, step) for _ in range(2))
+        changes = [change(form_class.ids.rangeslider(A_or_B, variable), 'value', value)]
+        preset = None
+        if clientside_sync:
+            preset, value = sync_dicts.rangeslider_preset(
+                variable, value, form_class.snap_tolerance(sync_dicts[variable]))
+            changes.append(change(form_class.ids.radioitems(A_or_B, variable), 'value', preset))
+        return 'slider commit', changes + filter_state_delta(A_or_B, variable, form_class, value, preset)
+
+    def toggle_not_audience_A():
+        state['not_audience_A'] = not state['not_audience_A']
+        return 'not audience A toggle', [
+            change({'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value',
+                   state['not_audience_A'])]
+
+    kinds = [(switch_project, 0.05), (toggle_collapse, 0.25), (click_preset, 0.35),
+             (commit_slider, 0.25), (toggle_not_audience_A, 0.10)]
+
+    name, changes = switch_project()
+    trace.append({'name' : name, 'changes' : changes})
+    for _ in range(n_interactions - 1):
+        kind = rng.choices([k for k, _ in kinds], weights = [w for _, w in kinds])[0]
+        name, changes = kind()
+        trace.append({'name' : name, 'changes' : changes})
+    return trace
+
+
+###############################################################################
+# 4. Runner and report
+###############################################################################
+
+class Stats:
+
+    def __init__(self):
+        self.seconds = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.seconds.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, elapsed):
+        lines = [f"{'callback / interaction':<70} {'n':>7} {'err':>5} {'req/s':>9} "
+                 f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}"]
+        for name, seconds in sorted(self.seconds.items()):
+            q = statistics.quantiles(seconds, n = 100, method = 'inclusive') if len(seconds) > 1 \
+                else seconds * 99
+            lines.append(
+                f"{name:<70} {len(seconds):>7} {self.errors.get(name, 0):>5} "
+                f"{len(seconds) / elapsed:>9.1f} {q[49] * 1e3:>9.2f} {q[89] * 1e3:>9.2f} {q[98] * 1e3:>9.2f}")
+        return "\n".join(lines)
+
+
+def start_local_app(host, port):
+    """Start application in a subprocess and return it once it answers."""
+    process = subprocess.Popen([
+        sys.executable, '-c',
+        "from werkzeug.serving import run_simple; "
+        "from overlapping_wildcard_error import application; "
+        f"run_simple({host!r}, {port}, application, threaded = True)"
+        ])
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout = 1)
+            connection.request('GET', '/_dash-layout')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The app did not start on {host}:{port}.")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--url', help = "app to load; by default one is started locally")
+    parser.add_argument('--port', type = int, default = 8051, help = "port of the local app")
+    parser.add_argument('--users', type = int, default = 20, help = "concurrent simulated users")
+    parser.add_argument('--interactions', type = int, default = 100, help = "interactions per user")
+    parser.add_argument('--projects', nargs = '+', default = ['Project 1'],
+                        help = "projects the users switch between")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--record', help = "write the synthesized traces to this path and exit")
+    parser.add_argument('--traces', help = "replay the traces at this path instead of synthesizing")
+    args = parser.parse_args(argv)
+
+    if args.traces:
+        with open(args.traces) as f:
+            traces = json.load(f)
+    else:
+        traces = [
+            synthesize_trace(args.projects, args.interactions, random.Random(args.seed + user))
+            for user in range(args.users)
+            ]
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(traces, f)
+        print(f"Wrote {len(traces)} traces to {args.record}")
+        return 0
+
+    process = None
+    url = args.url
+    if url is None:
+        process = start_local_app('127.0.0.1', args.port)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        split = urlsplit(url)
+        connection = http.client.HTTPConnection(split.hostname, split.port or 80, timeout = 60)
+        connection.request('GET', '/_dash-dependencies')
+        dependencies = json.loads(connection.getresponse().read())
+        names = callback_names()
+        callbacks = [
+            Callback(dependency, names.get(dependency['output'], dependency['output']))
+            for dependency in dependencies
+            if not dependency.get('clientside_function')
+            ]
+
+        stats = Stats()
+
+        def run_user(trace):
+            browser = Browser(url, callbacks, stats)
+            for interaction in trace:
+                browser.interact(interaction)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = len(traces)) as pool:
+            for future in [pool.submit(run_user, trace) for trace in traces]:
+                future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f"{len(traces)} users, {sum(len(t) for t in traces)} interactions in {elapsed:.1f} s")
+    print(stats.report(elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,50 @@ Created on Tue May  7 19:24:10 2024
 @author: Joseph.Moyes
 """
 
-from dash import Dash, dcc, html, callback, callback_context, Output, Input, State, MATCH, ALL, no_update
+import time
+STARTUP_START = time.perf_counter() # before the other imports, for startup_report()
+
+STARTUP_PHASES = {}
+STARTUP_MARK = STARTUP_START
+
+def startup_phase(name):
+    """Record the time since the previous phase, or since STARTUP_START, as phase name."""
+    global STARTUP_MARK
+    now = time.perf_counter()
+    STARTUP_PHASES[name] = now - STARTUP_MARK
+    STARTUP_MARK = now
+
+def startup_report():
+    """Return the duration of each phase of importing this module, as a table."""
+    lines = [f"{phase:<40} {seconds * 1e3:>10.1f} ms" for phase, seconds in STARTUP_PHASES.items()]
+    lines.append(f"{'total':<40} {sum(STARTUP_PHASES.values()) * 1e3:>10.1f} ms")
+    return "\n".join(lines)
+
+# the third-party imports dominate the cold start, so each is a phase of its own
+from dash import Dash, dcc, html, clientside_callback, callback_context, Output, Input, State, MATCH, ALL, no_update, Patch
+import dash
+startup_phase('import dash')
 import dash_bootstrap_components as dbc
+startup_phase('import dash_bootstrap_components')
+from plotly.io.json import to_json_plotly
+startup_phase('import plotly')
+import flask
+startup_phase('import flask')
+import base64
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import importlib
 import json
-import regex as re
+import math
+import os
+import re
+import tempfile
+import threading
+from types import SimpleNamespace
+from urllib.parse import quote
+import warnings
 
 app = Dash(
     __name__, 
@@ -17,10 +57,971 @@ app = Dash(
     )
 application = app.server
 
+class LazyModule:
+    
+    def __init__(self, name):
+        """
+        Stand-in for the module name, imported on first attribute access, for modules 
+        that only some modes use.
+        """
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# NumPy is only used by the audience engine, so workers that never evaluate an audience
+# never import it.
+np = LazyModule('numpy')
+
+# Seconds spent in each phase of importing this module, from STARTUP_START.
+startup_phase('stdlib imports and app')
+
+# Path of a snapshot written by build_startup_snapshot(), or None. If the snapshot was
+# built from this very file, app.layout and the filter menu layouts of its projects are
+# loaded from it rather than built from components. Otherwise it is ignored. Read from 
+# the environment, so that setting it leaves the file, and so the snapshot, current.
+STARTUP_SNAPSHOT = os.environ.get('FILTER_MENU_STARTUP_SNAPSHOT')
+
+class PrebuiltLayout(html.Div):
+    
+    def __init__(self, serialized):
+        """Layout served as serialized, a layout already serialized to plain JSON."""
+        super().__init__()
+        self._serialized = serialized
+    
+    def to_plotly_json(self):
+        return self._serialized
+    
+    def _traverse_with_paths(self):
+        # the components of the snapshot, as stand-ins holding their id, so that Dash 
+        # still validates the ids of the layout
+        def traverse(value, path):
+            if isinstance(value, dict):
+                if 'type' in value and 'props' in value:
+                    yield path, SimpleNamespace(id = value['props'].get('id'))
+                    value = value['props']
+                for key, item in value.items():
+                    yield from traverse(item, f"{path}.{key}" if path else key)
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    yield from traverse(item, f"{path}[{i}]")
+        
+        return traverse(self._serialized, "")
+
+def source_version():
+    """Return a hash of this file, which includes every mode setting."""
+    with open(__file__, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size = 16).hexdigest()
+
+def load_startup_snapshot(path):
+    """
+    Return the snapshot at path, having seeded LAYOUT_CACHE with its filter menu layouts,
+    or None if there is none or it was built from a different version of this file.
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        snapshot = json.load(f)
+    if snapshot['source'] != source_version():
+        return None
+    for project, A_or_B, version, layout, nbytes in snapshot['filtermenu_layouts']:
+        LAYOUT_CACHE.put((project, A_or_B, version), (layout, nbytes), nbytes)
+    return snapshot
+
 ############################################################################### 
-# 1. Component objects used to populate a filter menu
+# 1. Callback infrastructure shared by the components
 ###############################################################################
 
+class LRUCache:
+    
+    def __init__(self, maxsize, maxbytes):
+        """
+        Thread-safe LRU cache bounded by both its number of entries and their total size,
+        with counters for hits, misses and evictions.
+        
+        - maxsize: int, maximum number of entries held.
+        - maxbytes: int, maximum total nbytes of the entries held. An entry larger than
+            maxbytes is never cached.
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict() # key -> (value, nbytes)
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def lookup(self, key):
+        """Return the value cached under key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+    
+    def put(self, key, value, nbytes):
+        if nbytes > self.maxbytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while len(self._entries) > self.maxsize or self._nbytes > self.maxbytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last = False)
+                self._nbytes -= evicted_nbytes
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries' : len(self._entries),
+                'bytes' : self._nbytes,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'evictions' : self.evictions
+                }
+
+
+# Bounds for SYNC_DICT_CACHE. The byte budget is measured on the JSON string held
+# by 'Store-ProjectVariableSyncDicts', which is a fair proxy for the parsed size.
+SYNC_DICT_CACHE_MAXSIZE = 32
+SYNC_DICT_CACHE_MAXBYTES = 256 * 2**20
+
+class SyncDictCache(LRUCache):
+    
+    def __init__(self, maxsize, maxbytes):
+        """
+        Process-wide LRU cache of parsed project sync dicts, keyed by a content hash
+        (version token) of the JSON string held by 'Store-ProjectVariableSyncDicts', or
+        by the version token carried by a StoreVariableSyncDict slice or a 
+        SyncDictRegistry token.
+        
+        Every callback that reads the store shares this cache, so the JSON blob of a
+        project is parsed once per version rather than once per callback. Cached values
+        are shared between requests and must be treated as read-only.
+        
+        - maxsize: int, maximum number of parsed projects held.
+        - maxbytes: int, maximum total length of the JSON strings of the held projects.
+            A project larger than maxbytes is parsed but never cached.
+        """
+        super().__init__(maxsize, maxbytes)
+    
+    @staticmethod
+    def version(store_data):
+        return hashlib.blake2b(store_data.encode(), digest_size = 16).hexdigest()
+    
+    def get(self, store_data):
+        if isinstance(store_data, str):
+            version = self.version(store_data)
+        else:
+            version = store_data['version']
+            
+        parsed = self.lookup(version)
+        if parsed is not None:
+            return parsed
+        
+        if isinstance(store_data, str):
+            parsed = ProjectSyncDicts(json.loads(store_data))
+            nbytes = len(store_data)
+        elif 'sync_dict' in store_data:
+            parsed = ProjectSyncDicts({store_data['variable'] : store_data['sync_dict']})
+            nbytes = store_data['nbytes']
+        else:
+            serialized = SYNC_DICT_REGISTRY.read(store_data)
+            parsed = ProjectSyncDicts(json.loads(serialized))
+            nbytes = len(serialized)
+        self.put(version, parsed, nbytes)
+        return parsed
+
+
+def bitset(positions, n):
+    """Return the set of positions, all below n, as an int with those bits set."""
+    bits = bytearray((n + 7) // 8)
+    for i in positions:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+def bitset_positions(bits, n):
+    """Return the positions set in bits, in ascending order. Inverse of bitset()."""
+    return [
+        8 * j + k 
+        for j, byte in enumerate(bits.to_bytes((n + 7) // 8, 'little')) if byte
+        for k in range(8) if byte >> k & 1
+        ]
+
+
+class ProjectSyncDicts(dict):
+    
+    def __init__(self, sync_dicts):
+        """
+        The parsed {variable: sync dict} of a project, plus reverse indexes from a
+        selection back to the radioitem (preset) it corresponds to. Indexes are built
+        on first use of a variable and then kept for as long as the project is cached
+        in SYNC_DICT_CACHE.
+        
+        Sync dicts of dropdown variables may arrive encoded by encode_sync_dict(); they
+        are decoded here, so that self[variable] is always a plain sync dict.
+        
+        - sync_dicts: dictionary of {variable: {radioitem value: dropdown values or [x1,x2],
+                                                ...},
+                                     ...}
+        """
+        self._preset_bitsets = {}
+        super().__init__({
+            variable : self._decode(variable, sync_dict)
+            for variable, sync_dict in sync_dicts.items()
+            })
+        self._dropdown_indexes = {}
+        self._dropdown_positions = {}
+        self._search_indexes = {}
+        self._rangeslider_indexes = {}
+        self._rangeslider_grids = {}
+    
+    @staticmethod
+    def encode_sync_dict(radioitem2dropdownvalues_dict):
+        """
+        Return radioitem2dropdownvalues_dict encoded for the wire: the dropdown values of
+        'All' are listed once and every radioitem's dropdown values are sent as a base64
+        bitset of their positions in that list.
+        """
+        values = radioitem2dropdownvalues_dict['All']
+        positions = {v : i for i, v in enumerate(values)}
+        return {
+            'encoding' : 'bitset',
+            'values' : values,
+            'presets' : {
+                k : base64.b64encode(
+                    bitset((positions[x] for x in v), len(values)).to_bytes(
+                        (len(values) + 7) // 8, 'little')).decode()
+                for k, v in radioitem2dropdownvalues_dict.items()
+                }
+            }
+    
+    def _decode(self, variable, sync_dict):
+        if sync_dict.get('encoding') != 'bitset':
+            return sync_dict
+        values = sync_dict['values']
+        self._preset_bitsets[variable] = bitsets = {
+            k : int.from_bytes(base64.b64decode(v), 'little')
+            for k, v in sync_dict['presets'].items()
+            }
+        return {
+            k : [values[i] for i in bitset_positions(v, len(values))]
+            for k, v in bitsets.items()
+            }
+    
+    def dropdown_positions(self, variable):
+        """Return {dropdown value: position} for the dropdown values of 'All' of variable."""
+        positions = self._dropdown_positions.get(variable)
+        if positions is None:
+            positions = {v : i for i, v in enumerate(self[variable]['All'])}
+            self._dropdown_positions[variable] = positions
+        return positions
+    
+    def dropdown_value(self, variable, values):
+        """
+        Return the value of the dropdown of variable that selects values: the values 
+        themselves or, with COMPACT_DROPDOWN_VALUES, their positions in 'All'.
+        """
+        if COMPACT_DROPDOWN_VALUES:
+            positions = self.dropdown_positions(variable)
+            return [positions[v] for v in values]
+        return values
+    
+    def dropdown_options(self, variable, values):
+        """Return dropdown options listing values, whose option values are as in dropdown_value()."""
+        return [
+            {'label': label, 'value': value}
+            for label, value in zip(values, self.dropdown_value(variable, values))
+            ]
+    
+    def dropdown_labels(self, variable, dropdown_value):
+        """Return the values selected by dropdown_value. Inverse of dropdown_value()."""
+        if COMPACT_DROPDOWN_VALUES:
+            values = self[variable]['All']
+            return [values[i] for i in dropdown_value or ()]
+        return dropdown_value or []
+    
+    def selection_key(self, variable, dropdown_value):
+        """
+        Canonical, order-insensitive key of a dropdown selection: a frozenset of the 
+        values or, with COMPACT_DROPDOWN_VALUES, a bitset of their positions, so that 
+        comparing a selection with a preset is a single int comparison.
+        """
+        if COMPACT_DROPDOWN_VALUES:
+            return bitset(dropdown_value or (), len(self[variable]['All']))
+        return frozenset(dropdown_value or ())
+    
+    def dropdown_index(self, variable):
+        """
+        Return {selection key: radioitem value} for variable. Where several radioitems 
+        share a selection, the first one in the sync dict wins, as it did when the sync
+        dict was scanned in order.
+        """
+        index = self._dropdown_indexes.get(variable)
+        if index is None:
+            index = {}
+            if COMPACT_DROPDOWN_VALUES and variable in self._preset_bitsets:
+                for k, v in self._preset_bitsets[variable].items():
+                    index.setdefault(v, k)
+            else:
+                for k, v in self[variable].items():
+                    index.setdefault(self.selection_key(variable, self.dropdown_value(variable, v)), k)
+            self._dropdown_indexes[variable] = index
+        return index
+    
+    def dropdown_preset(self, variable, dropdown_value):
+        """Return the radioitem value whose dropdown values equal dropdown_value, or None."""
+        return self.dropdown_index(variable).get(self.selection_key(variable, dropdown_value))
+    
+    def search_index(self, variable):
+        """
+        Return (keys, values) for variable, where values are the dropdown values of 'All'
+        sorted by keys, their casefolded string forms, so that values matching a prefix
+        form a contiguous run found by bisection.
+        """
+        index = self._search_indexes.get(variable)
+        if index is None:
+            pairs = sorted((str(v).casefold(), v) for v in self[variable]['All'])
+            index = ([k for k, _ in pairs], [v for _, v in pairs])
+            self._search_indexes[variable] = index
+        return index
+    
+    def search(self, variable, search_value, k):
+        """Return up to k dropdown values of variable starting with search_value, ignoring case."""
+        keys, values = self.search_index(variable)
+        prefix = (search_value or '').casefold()
+        start = bisect_left(keys, prefix)
+        stop = start
+        while stop < len(keys) and stop - start < k and keys[stop].startswith(prefix):
+            stop += 1
+        return values[start:stop]
+    
+    def rangeslider_index(self, variable):
+        """
+        Return {(x1, x2): radioitem value} for variable. Where several radioitems share
+        a range, the first one in the sync dict wins.
+        """
+        index = self._rangeslider_indexes.get(variable)
+        if index is None:
+            index = {}
+            for k, v in self[variable].items():
+                index.setdefault(tuple(v), k)
+            self._rangeslider_indexes[variable] = index
+        return index
+    
+    def rangeslider_grid(self, variable, tolerance):
+        """
+        Return {(cell1, cell2): [(order, radioitem value, [x1,x2]), ...]} for variable,
+        where cells are the ranges' endpoints bucketed by tolerance and order is the 
+        radioitem's position in the sync dict. A range within tolerance of a preset then
+        lies in one of the 3x3 cells around its own cell.
+        """
+        grid = self._rangeslider_grids.get((variable, tolerance))
+        if grid is None:
+            grid = {}
+            for order, (v, k) in enumerate(self.rangeslider_index(variable).items()):
+                cell = (math.floor(v[0] / tolerance), math.floor(v[1] / tolerance))
+                grid.setdefault(cell, []).append((order, k, list(v)))
+            self._rangeslider_grids[(variable, tolerance)] = grid
+        return grid
+    
+    def rangeslider_preset(self, variable, rangeslider_value, tolerance = 0):
+        """
+        Return (radioitem value, rangeslider value) for rangeslider_value.
+        
+        With tolerance 0 only an exact match resolves to a radioitem. Otherwise the 
+        preset nearest to rangeslider_value (greatest endpoint distance) within tolerance
+        is returned together with its range, so the rangeslider can be snapped onto it.
+        Ties go to the radioitem that comes first in the sync dict. If nothing matches,
+        (None, rangeslider_value) is returned.
+        """
+        key = tuple(rangeslider_value)
+        radioitems_value = self.rangeslider_index(variable).get(key)
+        if radioitems_value is not None or not tolerance:
+            return radioitems_value, rangeslider_value
+        
+        grid = self.rangeslider_grid(variable, tolerance)
+        cell = (math.floor(key[0] / tolerance), math.floor(key[1] / tolerance))
+        nearest = (tolerance, math.inf, None, rangeslider_value)
+        for i in (-1, 0, 1):
+            for j in (-1, 0, 1):
+                for order, k, v in grid.get((cell[0] + i, cell[1] + j), ()):
+                    distance = max(abs(v[0] - key[0]), abs(v[1] - key[1]))
+                    if (distance, order) < nearest[:2]:
+                        nearest = (distance, order, k, v)
+        return nearest[2], nearest[3]
+
+
+SYNC_DICT_CACHE = SyncDictCache(SYNC_DICT_CACHE_MAXSIZE, SYNC_DICT_CACHE_MAXBYTES)
+
+def atomic_write(path, data, mode = 0o644):
+    """
+    Write data to path through a temporary file renamed over it, so that other workers 
+    never read a partial file, and make it readable by them, which may run as another user.
+    
+    - path: string, path of the file, whose directory is created if need be.
+    - data: string or bytes, the contents, or a function writing them to a binary file.
+    - mode: int, permissions of the file; mkstemp would leave it readable by its owner only.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    fd, tmp_path = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data.encode() if isinstance(data, str) else data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class SyncDictRegistry:
+    
+    def __init__(self, directory, cache):
+        """
+        Server-side registry of project sync dicts, keyed by project and version. The 
+        browser then holds only a small token, {'project': project, 'version': version},
+        in 'Store-ProjectVariableSyncDicts'.
+        
+        Registered sync dicts are written, content-addressed, to directory, which all
+        WSGI workers of the host share. A worker that did not register a version (or
+        has since evicted it) reads it back from there, so every worker resolves every 
+        token. Parsed sync dicts are held in cache, which bounds memory and evicts LRU.
+        
+        - directory: string, path of the directory shared by the workers.
+        - cache: SyncDictCache, holding the parsed sync dicts of recently used versions.
+        """
+        self.directory = directory
+        self.cache = cache
+    
+    def path(self, project, version):
+        # tokens come back from the browser, so keep them from escaping self.directory
+        if project in ('.', '..') or not re.fullmatch('[0-9a-f]{32}', version):
+            raise KeyError(f"Invalid sync dict token for project {project!r}.")
+        return os.path.join(self.directory, quote(project, safe = ''), version + '.json')
+        
+    def register(self, project, store_sync_dicts, serialized = None):
+        """
+        Register store_sync_dicts for project and return its token. serialized is 
+        store_sync_dicts as a JSON string, if already at hand.
+        """
+        if serialized is None:
+            serialized = json.dumps(store_sync_dicts)
+        version = SyncDictCache.version(serialized)
+        path = self.path(project, version)
+        
+        if not os.path.exists(path):
+            atomic_write(path, serialized)
+        
+        self.cache.put(version, ProjectSyncDicts(store_sync_dicts), len(serialized))
+        return {'project' : project, 'version' : version}
+    
+    def read(self, token):
+        """Return the JSON string registered under token, by this or any other worker."""
+        try:
+            with open(self.path(token['project'], token['version'])) as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(f"No sync dicts registered for project {token['project']!r} " +
+                           f"with version {token['version']!r}.")
+
+
+# Directory shared by the WSGI workers of a host, used when SYNC_STORE_MODE is 'registry'.
+SYNC_DICT_REGISTRY_DIR = os.path.join(tempfile.gettempdir(), 'filter_menu_sync_dicts')
+
+SYNC_DICT_REGISTRY = SyncDictRegistry(SYNC_DICT_REGISTRY_DIR, SYNC_DICT_CACHE)
+
+# Where the sync dicts of the selected project are kept:
+#   'json': a single JSON string in 'Store-ProjectVariableSyncDicts', holding every variable.
+#   'sliced': a StoreVariableSyncDict per variable, holding only that variable's sync dict
+#       as a native object. Each callback then uploads only the slice it reads.
+#   'registry': on the server, in SYNC_DICT_REGISTRY. 'Store-ProjectVariableSyncDicts' 
+#       holds only a token, so uploads no longer grow with the project.
+SYNC_STORE_MODE = 'json'
+
+# Intern the values of each dropdown variable once per project: dropdown option values
+# and selections become positions in the variable's 'All' list, and the sync dicts of
+# dropdown variables are stored encoded by ProjectSyncDicts.encode_sync_dict().
+COMPACT_DROPDOWN_VALUES = False
+
+# Keep every dropdown's options at the 'All' list it was built with: choosing a radioitem
+# then only sets the dropdown value, rather than resending the preset as the options, and
+# values outside the preset can still be added without going back to 'All'.
+STATIC_DROPDOWN_OPTIONS = False
+
+def sync_dicts(store_data):
+    """
+    Return the ProjectSyncDicts for store_data, the data of either 
+    'Store-ProjectVariableSyncDicts' or a StoreVariableSyncDict, as given by 
+    sync_dicts_state(). A slice resolves to a ProjectSyncDicts of its variable only.
+    """
+    return SYNC_DICT_CACHE.get(store_data)
+
+def sync_dicts_of_project(project):
+    """
+    Return the ProjectSyncDicts of project, built from project_definition(), for callbacks
+    that are not given a sync dict store. Definitions are taken to be fixed for the life 
+    of the process.
+    """
+    project_sync_dicts = SYNC_DICT_CACHE.lookup(('project', project))
+    if project_sync_dicts is None:
+        definition = project_definition(project)
+        store_sync_dicts = {**definition['D'], **definition['R']}
+        project_sync_dicts = ProjectSyncDicts(store_sync_dicts)
+        SYNC_DICT_CACHE.put(('project', project), project_sync_dicts, 
+                            len(json.dumps(store_sync_dicts)))
+    return project_sync_dicts
+
+def sync_dicts_state(variable):
+    """
+    State through which a callback reads the sync dict of variable (a value or wildcard),
+    according to SYNC_STORE_MODE.
+    """
+    if SYNC_STORE_MODE == 'sliced':
+        return State(StoreVariableSyncDict.ids.store(variable), 'data')
+    return State('Store-ProjectVariableSyncDicts', 'data')
+
+
+# Record, per server-side callback of this module, its wall time, the size of its request
+# and response and its fan-out, and expose them as histograms at /metrics. If False, 
+# callback() registers callbacks exactly as dash.callback does.
+INSTRUMENT_CALLBACKS = False
+
+class Histogram:
+    
+    def __init__(self, buckets):
+        """
+        Cumulative histogram in the Prometheus sense. Not thread-safe on its own: 
+        CallbackMetrics serializes observations.
+        
+        - buckets: sorted list of the bucket upper bounds, +Inf excluded.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class CallbackMetrics:
+    
+    # metric: bucket upper bounds
+    BUCKETS = {
+        'seconds' : [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+        'request_bytes' : [2**k for k in range(8, 27, 2)],
+        'response_bytes' : [2**k for k in range(8, 27, 2)],
+        'fanout' : [2**k for k in range(0, 13)]
+        }
+    
+    def __init__(self):
+        """
+        Histograms of CallbackMetrics.BUCKETS per callback, filled by callback() when 
+        INSTRUMENT_CALLBACKS. fanout is the number of component properties a callback
+        received as inputs and states, which grows with the components matched by ALL.
+        """
+        self._histograms = {} # (callback name, metric) -> Histogram
+        self._lock = threading.Lock()
+    
+    def observe(self, name, **values):
+        with self._lock:
+            for metric, value in values.items():
+                histogram = self._histograms.get((name, metric))
+                if histogram is None:
+                    histogram = self._histograms[(name, metric)] = Histogram(self.BUCKETS[metric])
+                histogram.observe(value)
+    
+    def exposition(self):
+        """Return the histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric in self.BUCKETS:
+                lines.append(f"# TYPE filter_menu_callback_{metric} histogram")
+                for (name, m), histogram in sorted(self._histograms.items()):
+                    if m != metric:
+                        continue
+                    cumulative = 0
+                    for le, count in zip([*histogram.buckets, '+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(
+                            f'filter_menu_callback_{metric}_bucket{{callback="{name}",le="{le}"}} {cumulative}')
+                    lines.append(f'filter_menu_callback_{metric}_sum{{callback="{name}"}} {histogram.sum}')
+                    lines.append(f'filter_menu_callback_{metric}_count{{callback="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+CALLBACK_METRICS = CallbackMetrics()
+
+def callback(*args, **kwargs):
+    """
+    dash.callback, recording the metrics of the decorated function in CALLBACK_METRICS
+    if INSTRUMENT_CALLBACKS. Wall time and fan-out are recorded around the function; the
+    request and response sizes by record_callback_payload(), once the response is built.
+    Background callbacks run outside the request, in the manager's processes, and are
+    not recorded.
+    """
+    if not INSTRUMENT_CALLBACKS:
+        return dash.callback(*args, **kwargs)
+    
+    def register(func):
+        name = func.__qualname__
+        
+        @wraps(func)
+        def instrumented(*func_args, **func_kwargs):
+            if not flask.has_request_context():
+                return func(*func_args, **func_kwargs)
+            start = time.perf_counter()
+            result = func(*func_args, **func_kwargs)
+            seconds = time.perf_counter() - start
+            
+            ctx = callback_context
+            fanout = sum(
+                len(x) if isinstance(x, list) else 1 
+                for x in [*ctx.inputs_list, *ctx.states_list])
+            CALLBACK_METRICS.observe(name, seconds = seconds, fanout = fanout)
+            flask.g.filter_menu_callback = name
+            return result
+        
+        return dash.callback(*args, **kwargs)(instrumented)
+    return register
+
+if INSTRUMENT_CALLBACKS:
+    @application.after_request
+    def record_callback_payload(response):
+        name = flask.g.pop('filter_menu_callback', None)
+        if name is not None:
+            CALLBACK_METRICS.observe(
+                name,
+                request_bytes = flask.request.content_length or 0,
+                response_bytes = response.calculate_content_length() or 0
+                )
+        return response
+
+
+# Run the stateless UI callbacks in the browser instead of on app.server. The Python
+# definitions are kept in either mode, so they remain importable and testable.
+CLIENTSIDE_UI_CALLBACKS = False
+
+# Likewise for sync_radioitems_and_dropdown() and sync_radioitems_and_rangelsider(),
+# which then read the sync dicts in the browser. Ignored if SYNC_STORE_MODE is 'registry',
+# since the browser then holds no sync dicts, and for dropdowns if COMPACT_DROPDOWN_VALUES.
+CLIENTSIDE_SYNC_CALLBACKS = False
+
+def ui_callback(clientside_function, *args, clientside = None, enabled = True, **kwargs):
+    """
+    Decorator used in place of dash.callback for callbacks that have a JavaScript
+    equivalent. In clientside mode, clientside_function (a JavaScript function, as a 
+    string) is registered against the given dependencies and the decorated Python 
+    function is returned unregistered. Otherwise the Python function is registered as usual.
+    
+    - clientside: bool, whether to use clientside mode. Defaults to CLIENTSIDE_UI_CALLBACKS.
+    - enabled: bool, if False nothing is registered, for callbacks that only some modes need.
+    """
+    if clientside is None:
+        clientside = CLIENTSIDE_UI_CALLBACKS
+        
+    def register(func):
+        if not enabled:
+            return func
+        if clientside:
+            clientside_callback(clientside_function, *args, **kwargs)
+            return func
+        return callback(*args, **kwargs)(func)
+    return register
+
+def callback_if(enabled, *args, **kwargs):
+    """
+    Decorator used in place of dash.callback for callbacks that only some modes need.
+    The decorated function is registered if enabled and is returned either way.
+    """
+    def register(func):
+        return callback(*args, **kwargs)(func) if enabled else func
+    return register
+
+
+# Send only the buttons of the filter menus when a project loads, and render the body of
+# each FormWithRadioitemsAndDropdown / FormWithRadioitemsAndRangeslider collapse the 
+# first time it is opened.
+LAZY_FILTER_MENUS = False
+
+# Keep the selections of every variable of both audiences in 'Store-FilterState', updated 
+# by deltas: a clientside callback turns each form change into a small delta in 
+# 'Store-FilterStateDelta', which apply_filter_state_delta() applies to the filter state
+# and to the footers with Patch. The markdown_children_update() methods are then unused.
+FILTER_STATE_STORE = False
+
+# Show the size of each audience in its footer, as evaluated by AudienceEngine over the
+# project's respondent table. The sizes are computed from 'Store-FilterState', so this
+# needs FILTER_STATE_STORE.
+AUDIENCE_COUNTS = False
+
+# Evaluate dropdown filters with a BitmapIndex: an audience is then the rows of the 
+# selected values within each variable, precomputed per value, and an AND across 
+# variables, rather than a table scan.
+AUDIENCE_BITMAP_INDEX = False
+
+# Count rangeslider filters with a RangeIndex: a [x1, x2] filter then selects a run of a
+# presorted column found by two binary searches, rather than comparing every respondent.
+# This gives the size of an audience filtered by a single rangeslider variable; audiences
+# that need a mask still compare the column.
+AUDIENCE_RANGE_INDEX = False
+
+# Keep the respondent tables of projects in PROJECT_DATA, one .npy file per column, and 
+# memory-map them, so that the WSGI workers of a host share them through the page cache
+# and a project is paged in as queried rather than loaded whole into every worker.
+MMAP_PROJECT_DATA = False
+
+# Run the audience evaluation as a Dash background callback, in a process of 
+# BACKGROUND_CALLBACK_MANAGER, so that slow queries do not hold a request thread. A job 
+# still running when the filter state changes again is cancelled by Dash, as is any job 
+# once the project changes, and a spinner shows in the footers while a job runs.
+BACKGROUND_AUDIENCE_COUNTS = False
+
+# Directory of the diskcache that backs BACKGROUND_CALLBACK_MANAGER. Being local to the
+# host, no broker is needed.
+BACKGROUND_CALLBACK_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'filter_menu_callbacks')
+
+if BACKGROUND_AUDIENCE_COUNTS:
+    import diskcache
+    from dash import DiskcacheManager
+    BACKGROUND_CALLBACK_MANAGER = DiskcacheManager(diskcache.Cache(BACKGROUND_CALLBACK_CACHE_DIR))
+else:
+    BACKGROUND_CALLBACK_MANAGER = None
+
+def background_kwargs(enabled, running = None, cancel = None):
+    """
+    Return the dash.callback kwargs that run a callback in the background with 
+    BACKGROUND_CALLBACK_MANAGER if enabled, or {} to run it in the request thread.
+    """
+    if not enabled:
+        return {}
+    return dict(
+        background = True,
+        manager = BACKGROUND_CALLBACK_MANAGER,
+        running = running,
+        cancel = cancel
+        )
+
+
+# JavaScript equivalents of the stateless UI callbacks, registered through ui_callback().
+
+TOGGLE_COLLAPSE_JS = """
+function(n_clicks, is_open) {
+    return !is_open;
+}
+"""
+
+REQUEST_COLLAPSE_BODY_JS = """
+function(n_clicks) {
+    return n_clicks === 1 ? true : dash_clientside.no_update;
+}
+"""
+
+MARKDOWN_VALUE_COLOR_UPDATE_JS = """
+function(markdown_value) {
+    return markdown_value === "All" ? "" : "text-info";
+}
+"""
+
+EXPAND_OR_COLLAPSE_FILTERMENU_JS = """
+function(button, checkbox, is_open) {
+    const prop_id = dash_clientside.callback_context.triggered[0].prop_id;
+    const trigger_id = JSON.parse(prop_id.slice(0, prop_id.lastIndexOf('.')));
+    if (trigger_id.component === 'Button-OpenFilterOptions') {
+        return [!is_open, dash_clientside.no_update];
+    }
+    return [false, !checkbox];
+}
+"""
+
+# The sync callbacks parse the store (or take the StoreVariableSyncDict slice) once per
+# version and keep their indexes on window.filterMenuSyncDicts, mirroring SyncDictCache
+# and ProjectSyncDicts. Keys of a sync dict are visited in insertion order, as they are
+# in Python, unless they look like integers.
+
+# %(static_options)s is filled in with STATIC_DROPDOWN_OPTIONS when the callback is registered.
+SYNC_RADIOITEMS_AND_DROPDOWN_JS = """
+function(radioitems_value, dropdown_value, store_data) {
+    const prop_id = dash_clientside.callback_context.triggered[0].prop_id;
+    const trigger_id = JSON.parse(prop_id.slice(0, prop_id.lastIndexOf('.')));
+    const caches = window.filterMenuSyncDicts || (window.filterMenuSyncDicts = new Map());
+    const version = typeof store_data === 'string' ? store_data : store_data.version;
+    let cache = caches.get(version);
+    if (cache === undefined) {
+        if (caches.size >= 64) {
+            caches.clear();
+        }
+        cache = {
+            parsed: typeof store_data === 'string' ? JSON.parse(store_data)
+                : {[store_data.variable]: store_data.sync_dict},
+            dropdown_indexes: {}
+        };
+        caches.set(version, cache);
+    }
+    const sync_dict = cache.parsed[trigger_id.variable];
+
+    if (trigger_id.subcomponent === 'radioitems') {
+        dropdown_value = sync_dict[radioitems_value];
+        const dropdown_options = %(static_options)s ? dash_clientside.no_update
+            : dropdown_value.map(i => ({label: i, value: i}));
+        return [dropdown_value, dropdown_options, radioitems_value];
+    }
+
+    const selection_key = v => JSON.stringify(Array.from(new Set(v || [])).sort());
+    let index = cache.dropdown_indexes[trigger_id.variable];
+    if (index === undefined) {
+        index = new Map();
+        for (const [k, v] of Object.entries(sync_dict)) {
+            const key = selection_key(v);
+            if (!index.has(key)) {
+                index.set(key, k);
+            }
+        }
+        cache.dropdown_indexes[trigger_id.variable] = index;
+    }
+    const preset = index.get(selection_key(dropdown_value));
+    return [dropdown_value, dash_clientside.no_update, preset === undefined ? null : preset];
+}
+"""
+
+# %(snap_steps)s is filled in with RANGESLIDER_SNAP_STEPS when the callback is registered.
+SYNC_RADIOITEMS_AND_RANGESLIDER_JS = """
+function(radioitems_value, rangeslider_value, store_data) {
+    const prop_id = dash_clientside.callback_context.triggered[0].prop_id;
+    const trigger_id = JSON.parse(prop_id.slice(0, prop_id.lastIndexOf('.')));
+    const caches = window.filterMenuSyncDicts || (window.filterMenuSyncDicts = new Map());
+    const version = typeof store_data === 'string' ? store_data : store_data.version;
+    let cache = caches.get(version);
+    if (cache === undefined) {
+        if (caches.size >= 64) {
+            caches.clear();
+        }
+        cache = {
+            parsed: typeof store_data === 'string' ? JSON.parse(store_data)
+                : {[store_data.variable]: store_data.sync_dict},
+            dropdown_indexes: {}
+        };
+        caches.set(version, cache);
+    }
+    const sync_dict = cache.parsed[trigger_id.variable];
+
+    if (trigger_id.subcomponent === 'radioitems') {
+        return [sync_dict[radioitems_value], radioitems_value];
+    }
+
+    const tolerance = %(snap_steps)s * (sync_dict['All'][1] > 100000 ? 1000 : 1);
+    let nearest = [tolerance, null, rangeslider_value];
+    for (const [k, v] of Object.entries(sync_dict)) {
+        const distance = Math.max(
+            Math.abs(v[0] - rangeslider_value[0]), Math.abs(v[1] - rangeslider_value[1]));
+        if (distance < nearest[0] || (distance === nearest[0] && nearest[1] === null)) {
+            nearest = [distance, k, v];
+        }
+    }
+    return [nearest[2], nearest[1]];
+}
+"""
+
+
+# Python equivalent: filter_state_delta().
+FILTER_STATE_DELTA_JS = """
+function(dropdown_D, radioitems_D, dropdown_S, radioitems_S, rangeslider_R, radioitems_R) {
+    const ctx = dash_clientside.callback_context;
+    const form_key = id => id.A_or_B + '|' + id.variable;
+    const triggered = new Set(ctx.triggered.map(t => {
+        const trigger_id = JSON.parse(t.prop_id.slice(0, t.prop_id.lastIndexOf('.')));
+        return form_key(trigger_id);
+    }));
+    const deltas = [];
+    ['D', 'S', 'R'].forEach((var_type, g) => {
+        const presets = {};
+        ctx.inputs_list[2 * g + 1].forEach(x => { presets[form_key(x.id)] = x.value; });
+        ctx.inputs_list[2 * g].forEach(x => {
+            const key = form_key(x.id);
+            if (triggered.has(key)) {
+                deltas.push({
+                    A_or_B: x.id.A_or_B,
+                    var_type: var_type,
+                    variable: x.id.variable,
+                    value: x.value === undefined ? null : x.value,
+                    preset: presets[key] === undefined ? null : presets[key]
+                });
+            }
+        });
+    });
+    return deltas.length ? deltas : dash_clientside.no_update;
+}
+"""
+
+
+startup_phase('infrastructure')
+
+
+############################################################################### 
+# 2. Component objects used to populate a filter menu
+###############################################################################
+
+class StoreVariableSyncDict(dcc.Store):
+    
+    class ids:
+        
+        store = lambda variable: {
+            'component': 'StoreVariableSyncDict',
+            'variable': variable
+        }
+    
+    ids = ids
+    
+    def __init__(self, variable, sync_dict):
+        """
+        Store holding the sync dict of a single variable, used when SYNC_STORE_MODE is 
+        'sliced'. The data is a native object rather than a JSON string:
+            {'variable': variable, 'version': version token, 'nbytes': serialized size,
+             'sync_dict': sync_dict}
+        
+        - variable: string, denotes which variable this component is built for. Shared by 
+            the filter menus of both audiences.
+        - sync_dict: dictionary of {radioitem value: dropdown values or [x1,x2], ...}
+        """
+        super().__init__(
+            id = self.ids.store(variable),
+            data = self.slice(variable, sync_dict)
+            )
+    
+    @staticmethod
+    def slice(variable, sync_dict):
+        serialized = json.dumps({variable : sync_dict})
+        return {
+            'variable' : variable,
+            'version' : SyncDictCache.version(serialized),
+            'nbytes' : len(serialized),
+            'sync_dict' : sync_dict
+            }
+            
+
 class MarkdownInFilterFooter(dcc.Markdown):
     
     class ids:
@@ -52,10 +1053,12 @@ class MarkdownInFilterFooter(dcc.Markdown):
             A or Audience B.
         - var_type: string, denotes what variable type the instance belongs to:
             'D': discrete/dropdown variable
+            'S': discrete/searchable dropdown variable, with too many values to list
             'R': ratio/rangeslider variable
             This avoids an 'overlapping wildcard callback outputs' error caused by
-            the markdown_children_update() method of both FormWithRadioitemsAndDropdown
-            and FormWithRadioitemsAndRangeslider, respectively.
+            the markdown_children_update() method of FormWithRadioitemsAndDropdown,
+            FormWithRadioitemsAndSearchableDropdown and FormWithRadioitemsAndRangeslider,
+            respectively.
         - variable: string, denotes which variable this component is built for. Together, 
             the combination of A_or_B and variable must be unique to a given instance.
             variable is also assigned to the children property of button.                    
@@ -64,8 +1067,8 @@ class MarkdownInFilterFooter(dcc.Markdown):
         id_ = self.ids.markdown_name(A_or_B, var_type, variable) if name_or_value == 'name' \
             else self.ids.markdown_value(A_or_B, var_type, variable)
         
-        if var_type not in ['D', 'R']:
-            raise ValueError("var_type should be one of ['D', 'R']")
+        if var_type not in ['D', 'S', 'R']:
+            raise ValueError("var_type should be one of ['D', 'S', 'R']")
         
         # classname:
         className = "text-primary" if A_or_B == "A" else "text-secondary" 
@@ -83,7 +1086,8 @@ class MarkdownInFilterFooter(dcc.Markdown):
             style = {"height" : "1rem"}
             )
             
-    @callback(
+    @ui_callback(
+        MARKDOWN_VALUE_COLOR_UPDATE_JS,
         Output(ids.markdown_value(MATCH, MATCH, MATCH), 'className'),
         Input(ids.markdown_value(MATCH, MATCH, MATCH), 'children'),
         prevent_initial_call = True
@@ -93,6 +1097,8 @@ class MarkdownInFilterFooter(dcc.Markdown):
 
 
 class FormWithRadioitemsAndDropdown(dbc.Form):
+    
+    var_type = 'D'
 
     class ids:
         
@@ -127,6 +1133,14 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
             'A_or_B' : A_or_B,            
             'variable': variable
             }
+        
+        # store set once the collapse is first opened, if lazy
+        collapse_body_request = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndDropdown',
+            'subcomponent': 'collapse_body_request',
+            'A_or_B' : A_or_B,            
+            'variable': variable
+            }
 
     ids = ids
         
@@ -134,7 +1148,8 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
         self,
         A_or_B,
         variable,
-        radioitem2dropdownvalues_dict
+        radioitem2dropdownvalues_dict,
+        lazy = False
         ):
         """FormWithRadioitemsAndDropdown is composed of button and collapse. The button 
         opens/closes collapse, which contains radioitems and dropdown. 
@@ -153,19 +1168,15 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
             variable is also assigned to the children property of button.     
         - radioitem2dropdownvalues_dict: dictionary of {radioitem value: dropdown values,
                                                         ...}
+        - lazy: bool, if True the collapse is left empty and its body is only rendered, by
+            render_collapse_body(), the first time it is opened.
         """
                 
         className = "text-primary" if A_or_B == "A" else "text-secondary"
-        color = className
                 
-        try:
-            dropdown_options = radioitem2dropdownvalues_dict['All']
-        except KeyError:
+        if 'All' not in radioitem2dropdownvalues_dict:
             raise KeyError("radioitem2dropdownvalues_dict does not contain a key named " +
                            "'All'. This is required to specify dropdown options.")
-
-        radioitem_options = ['All'] + [x for x in radioitem2dropdownvalues_dict.keys()
-                                       if x != 'All']
         
         # layout:
         super().__init__(
@@ -179,40 +1190,67 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
                     n_clicks = 0
                     ),
                 
+                dcc.Store(
+                    id = self.ids.collapse_body_request(A_or_B, variable)
+                    ) if lazy else None,
+                
                 dbc.Collapse(
-                    [
-                        dbc.RadioItems(
-                            id = self.ids.radioitems(A_or_B, variable),
-                            options = [
-                                {'label': i, 'value' : i}
-                                for i in radioitem_options
-                                ],
-                            value = 'All',
-                            inline = True,
-                            labelStyle = {
-                                "font-size" : 'small',
-                                "color" : color
-                                }
-                            ),
-                        dcc.Dropdown(
-                            id = self.ids.dropdown(A_or_B, variable),
-                            multi = True,
-                            options = dropdown_options,
-                            value = dropdown_options,
-                            className = 'dash-bootstrap',
-                            style = {
-                                "font-size" : 'small',
-                                "color" :  color
-                                }
-                            )
-                        ],
+                    [] if lazy else self.collapse_body(
+                        A_or_B, variable, radioitem2dropdownvalues_dict),
                     id = self.ids.collapse(A_or_B, variable),
                     is_open = False
                     )
                 ]
             )
     
-    @callback(
+    @classmethod
+    def collapse_body(cls, A_or_B, variable, radioitem2dropdownvalues_dict):
+        """Return the radioitems and dropdown that the collapse wraps."""
+        
+        color = "text-primary" if A_or_B == "A" else "text-secondary"
+        
+        dropdown_options = radioitem2dropdownvalues_dict['All']
+        dropdown_value = dropdown_options
+        
+        if COMPACT_DROPDOWN_VALUES:
+            dropdown_options = [
+                {'label': v, 'value': i}
+                for i, v in enumerate(dropdown_options)
+                ]
+            dropdown_value = list(range(len(dropdown_options)))
+        
+        radioitem_options = ['All'] + [x for x in radioitem2dropdownvalues_dict.keys()
+                                       if x != 'All']
+        
+        return [
+            dbc.RadioItems(
+                id = cls.ids.radioitems(A_or_B, variable),
+                options = [
+                    {'label': i, 'value' : i}
+                    for i in radioitem_options
+                    ],
+                value = 'All',
+                inline = True,
+                labelStyle = {
+                    "font-size" : 'small',
+                    "color" : color
+                    }
+                ),
+            dcc.Dropdown(
+                id = cls.ids.dropdown(A_or_B, variable),
+                multi = True,
+                options = dropdown_options,
+                value = dropdown_value,
+                className = 'dash-bootstrap',
+                style = {
+                    "font-size" : 'small',
+                    "color" :  color
+                    }
+                )
+            ]
+    
+    @ui_callback(
+        TOGGLE_COLLAPSE_JS,
         Output(ids.collapse(MATCH, MATCH), 'is_open'),        
         Input(ids.button(MATCH, MATCH), 'n_clicks'),
         State(ids.collapse(MATCH, MATCH), 'is_open'),
@@ -221,7 +1259,32 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
     def toggle_collapse(n_clicks, is_open):
         return not is_open
     
-    @callback(
+    @ui_callback(
+        REQUEST_COLLAPSE_BODY_JS,
+        Output(ids.collapse_body_request(MATCH, MATCH), 'data'),
+        Input(ids.button(MATCH, MATCH), 'n_clicks'),
+        prevent_initial_call = True,
+        enabled = LAZY_FILTER_MENUS
+        )
+    def request_collapse_body(n_clicks):
+        return True if n_clicks == 1 else no_update
+    
+    @callback_if(
+        LAZY_FILTER_MENUS,
+        Output(ids.collapse(MATCH, MATCH), 'children'),
+        Input(ids.collapse_body_request(MATCH, MATCH), 'data'),
+        sync_dicts_state(MATCH),
+        prevent_initial_call = True
+        )
+    def render_collapse_body(collapse_body_request, store_data):
+        collapse_id = callback_context.outputs_list['id']
+        variable = collapse_id['variable']
+        return FormWithRadioitemsAndDropdown.collapse_body(
+            collapse_id['A_or_B'], variable, sync_dicts(store_data)[variable])
+    
+    @ui_callback(
+        SYNC_RADIOITEMS_AND_DROPDOWN_JS % dict(
+            static_options = 'true' if STATIC_DROPDOWN_OPTIONS else 'false'),
         Output(ids.dropdown(MATCH, MATCH), 'value'),
         Output(ids.dropdown(MATCH, MATCH), 'options'),
         
@@ -231,38 +1294,40 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
         
         Input(ids.dropdown(MATCH, MATCH), 'value'),
         
-        State('Store-ProjectVariableSyncDicts', 'data'),        
-        prevent_initial_call = True
+        sync_dicts_state(MATCH),        
+        prevent_initial_call = True,
+        clientside = CLIENTSIDE_SYNC_CALLBACKS and SYNC_STORE_MODE != 'registry' \
+            and not COMPACT_DROPDOWN_VALUES
         )
     def sync_radioitems_and_dropdown(radioitems_value, dropdown_value, store_data):
         ctx = callback_context
         trigger_id_dict = list(ctx.triggered_prop_ids.values())[0]
-        sync_dict = json.loads(store_data)[trigger_id_dict['variable']]
+        project_sync_dicts = sync_dicts(store_data)
+        variable = trigger_id_dict['variable']
         
         if trigger_id_dict['subcomponent'] == 'radioitems':
-            dropdown_value = sync_dict[radioitems_value]
-            dropdown_options = [{'label':i, 'value':i}
-                                for i in dropdown_value]
+            values = project_sync_dicts[variable][radioitems_value]
+            dropdown_value = project_sync_dicts.dropdown_value(variable, values)
+            if STATIC_DROPDOWN_OPTIONS:
+                dropdown_options = no_update
+            else:
+                dropdown_options = project_sync_dicts.dropdown_options(variable, values)
             
         else: 
-            for k, v in sync_dict.items():
-                if sorted(v) == sorted(dropdown_value):
-                    radioitems_value = k
-                    break
-            else:
-                radioitems_value = None
+            radioitems_value = project_sync_dicts.dropdown_preset(variable, dropdown_value)
             dropdown_options = no_update  
             
         return dropdown_value, dropdown_options, radioitems_value
            
-    @callback(
+    @callback_if(
+        not FILTER_STATE_STORE,
         output = dict(
             markdown_children_A = Output(MarkdownInFilterFooter.ids.markdown_value('A', 'D', MATCH), 'children'),
             markdown_children_B = Output(MarkdownInFilterFooter.ids.markdown_value('B', 'D', MATCH), 'children')
             ),
         inputs = dict(
             dropdown_value = Input(ids.dropdown(ALL, MATCH), 'value'),
-            store_data = State('Store-ProjectVariableSyncDicts', 'data'),
+            store_data = sync_dicts_state(MATCH),
             not_audience_A = State({'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value'),
             ),
         prevent_initial_call = True,
@@ -278,14 +1343,250 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
         if not dropdown_value: 
             markdown_children = "-"
         else:
-            sync_dict = json.loads(store_data)[variable]
+            project_sync_dicts = sync_dicts(store_data)
+            markdown_children = project_sync_dicts.dropdown_preset(variable, dropdown_value)
             
-            for k, v in sync_dict.items():
-                if sorted(v) == sorted(dropdown_value):
-                    markdown_children = k
-                    break
-            else:
-                markdown_children = ", ".join(dropdown_value)
+            if markdown_children is None:
+                markdown_children = ", ".join(
+                    project_sync_dicts.dropdown_labels(variable, dropdown_value))
+               
+        if A_or_B == 'B':
+            markdown_children_B = markdown_children
+            markdown_children_A = no_update
+        else:
+            markdown_children_A = markdown_children
+            markdown_children_B = 'NOT '+markdown_children if not_audience_A else no_update
+            
+        return dict(markdown_children_A = markdown_children_A, 
+                    markdown_children_B = markdown_children_B) 
+            
+    
+# Dropdown variables with more values than this are built as 
+# FormWithRadioitemsAndSearchableDropdown, which lists at most 
+# SEARCHABLE_DROPDOWN_TOP_K options at a time. None builds every dropdown in full.
+SEARCHABLE_DROPDOWN_THRESHOLD = 5000
+SEARCHABLE_DROPDOWN_TOP_K = 50
+
+class FormWithRadioitemsAndSearchableDropdown(FormWithRadioitemsAndDropdown):
+    
+    var_type = 'S'
+
+    class ids:
+        
+        # button that toggles collapse
+        button = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndSearchableDropdown',
+            'subcomponent': 'button',
+            'A_or_B' : A_or_B,            
+            'variable': variable
+            }
+        
+        # collapse that wraps radioitems and dropdown
+        collapse = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndSearchableDropdown',
+            'subcomponent': 'collapse',
+            'A_or_B' : A_or_B,
+            'variable': variable
+            }        
+        
+        # radioitem per variable filter option
+        radioitems = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndSearchableDropdown',
+            'subcomponent': 'radioitems',
+            'A_or_B' : A_or_B,            
+            'variable': variable
+            }
+                
+        # dropdown searching all variable values
+        dropdown = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndSearchableDropdown',
+            'subcomponent': 'dropdown',
+            'A_or_B' : A_or_B,            
+            'variable': variable
+            }
+        
+        # store set once the collapse is first opened, if lazy
+        collapse_body_request = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndSearchableDropdown',
+            'subcomponent': 'collapse_body_request',
+            'A_or_B' : A_or_B,            
+            'variable': variable
+            }
+
+    ids = ids
+    
+    # FormWithRadioitemsAndSearchableDropdown is built by the __init__ of 
+    # FormWithRadioitemsAndDropdown, with the collapse_body below.
+    
+    @staticmethod
+    def is_searchable(radioitem2dropdownvalues_dict):
+        return SEARCHABLE_DROPDOWN_THRESHOLD is not None and \
+            len(radioitem2dropdownvalues_dict['All']) > SEARCHABLE_DROPDOWN_THRESHOLD
+    
+    @classmethod
+    def collapse_body(cls, A_or_B, variable, radioitem2dropdownvalues_dict):
+        """
+        Return the radioitems and dropdown that the collapse wraps. 
+        
+        Unlike FormWithRadioitemsAndDropdown, the dropdown neither lists every value nor 
+        holds the values of the selected radioitem. While the dropdown is empty, the 
+        selection is that of the radioitem, resolved on the server from the sync dict. 
+        Values picked in the dropdown replace it, and options are served by
+        sync_radioitems_and_dropdown() as the user types.
+        """
+        
+        color = "text-primary" if A_or_B == "A" else "text-secondary"
+        
+        radioitem_options = ['All'] + [x for x in radioitem2dropdownvalues_dict.keys()
+                                       if x != 'All']
+        
+        return [
+            dbc.RadioItems(
+                id = cls.ids.radioitems(A_or_B, variable),
+                options = [
+                    {'label': i, 'value' : i}
+                    for i in radioitem_options
+                    ],
+                value = 'All',
+                inline = True,
+                labelStyle = {
+                    "font-size" : 'small',
+                    "color" : color
+                    }
+                ),
+            dcc.Dropdown(
+                id = cls.ids.dropdown(A_or_B, variable),
+                multi = True,
+                options = [],
+                value = [],
+                placeholder = "Search {:,} values...".format(
+                    len(radioitem2dropdownvalues_dict['All'])),
+                className = 'dash-bootstrap',
+                style = {
+                    "font-size" : 'small',
+                    "color" :  color
+                    }
+                )
+            ]
+    
+    @ui_callback(
+        TOGGLE_COLLAPSE_JS,
+        Output(ids.collapse(MATCH, MATCH), 'is_open'),        
+        Input(ids.button(MATCH, MATCH), 'n_clicks'),
+        State(ids.collapse(MATCH, MATCH), 'is_open'),
+        prevent_initial_call = True
+        )
+    def toggle_collapse(n_clicks, is_open):
+        return not is_open
+    
+    @ui_callback(
+        REQUEST_COLLAPSE_BODY_JS,
+        Output(ids.collapse_body_request(MATCH, MATCH), 'data'),
+        Input(ids.button(MATCH, MATCH), 'n_clicks'),
+        prevent_initial_call = True,
+        enabled = LAZY_FILTER_MENUS
+        )
+    def request_collapse_body(n_clicks):
+        return True if n_clicks == 1 else no_update
+    
+    @callback_if(
+        LAZY_FILTER_MENUS,
+        Output(ids.collapse(MATCH, MATCH), 'children'),
+        Input(ids.collapse_body_request(MATCH, MATCH), 'data'),
+        sync_dicts_state(MATCH),
+        prevent_initial_call = True
+        )
+    def render_collapse_body(collapse_body_request, store_data):
+        collapse_id = callback_context.outputs_list['id']
+        variable = collapse_id['variable']
+        return FormWithRadioitemsAndSearchableDropdown.collapse_body(
+            collapse_id['A_or_B'], variable, sync_dicts(store_data)[variable])
+    
+    # Searching is handled here too, rather than in a callback of its own, since two 
+    # callbacks writing the dropdown options through MATCH would overlap. The sync dicts
+    # are resolved on the server from the selected project, so that neither a keystroke
+    # nor a selection uploads the project's values.
+    @callback(
+        Output(ids.dropdown(MATCH, MATCH), 'value'),
+        Output(ids.dropdown(MATCH, MATCH), 'options'),
+        
+        Output(ids.radioitems(MATCH, MATCH), 'value'),
+        
+        Input(ids.radioitems(MATCH, MATCH), 'value'),
+        
+        Input(ids.dropdown(MATCH, MATCH), 'value'),
+        Input(ids.dropdown(MATCH, MATCH), 'search_value'),
+        
+        State('Dropdown-SelectedProject', 'value'),
+        prevent_initial_call = True
+        )
+    def sync_radioitems_and_dropdown(radioitems_value, dropdown_value, search_value, selected_project):
+        ctx = callback_context
+        prop_id, trigger_id_dict = next(iter(ctx.triggered_prop_ids.items()))
+        variable = trigger_id_dict['variable']
+        
+        if prop_id.endswith('.search_value'):
+            # the selected values stay listed, so that the dropdown can still show them
+            if not search_value:
+                return no_update, no_update, no_update
+            project_sync_dicts = sync_dicts_of_project(selected_project)
+            matches = project_sync_dicts.search(variable, search_value, SEARCHABLE_DROPDOWN_TOP_K)
+            selected = project_sync_dicts.dropdown_labels(variable, dropdown_value)
+            selected_set = set(selected)
+            dropdown_options = project_sync_dicts.dropdown_options(
+                variable, selected + [i for i in matches if i not in selected_set])
+            return no_update, dropdown_options, no_update
+        
+        if trigger_id_dict['subcomponent'] == 'radioitems':
+            # the radioitem's values are left on the server, see collapse_body()
+            dropdown_value = []
+            dropdown_options = []
+            
+        elif not dropdown_value:
+            radioitems_value = None
+            dropdown_options = no_update
+            
+        else: 
+            radioitems_value = sync_dicts_of_project(selected_project).dropdown_preset(
+                variable, dropdown_value)
+            dropdown_options = no_update  
+            
+        return dropdown_value, dropdown_options, radioitems_value
+    
+    @callback_if(
+        not FILTER_STATE_STORE,
+        output = dict(
+            markdown_children_A = Output(MarkdownInFilterFooter.ids.markdown_value('A', 'S', MATCH), 'children'),
+            markdown_children_B = Output(MarkdownInFilterFooter.ids.markdown_value('B', 'S', MATCH), 'children')
+            ),
+        inputs = dict(
+            dropdown_value = Input(ids.dropdown(ALL, MATCH), 'value'),
+            radioitems_value = State(ids.radioitems(ALL, MATCH), 'value'),
+            store_data = sync_dicts_state(MATCH),
+            not_audience_A = State({'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value'),
+            ),
+        prevent_initial_call = True,
+        allow_duplicate = True
+        )
+    def markdown_children_update(dropdown_value, radioitems_value, store_data, not_audience_A):
+        A_or_B = next(iter(callback_context.triggered_prop_ids.values()))['A_or_B']
+        variable = next(iter(callback_context.triggered_prop_ids.values()))['variable']
+        dropdown_value = next(iter(callback_context.triggered))['value']
+        radioitems_value = next(
+            x['value'] for x in callback_context.args_grouping.radioitems_value
+            if x['id']['A_or_B'] == A_or_B)
+        store_data = callback_context.args_grouping.store_data['value']
+        not_audience_A = callback_context.args_grouping.not_audience_A['value']
+        
+        if not dropdown_value: 
+            markdown_children = "-" if radioitems_value is None else radioitems_value
+        else:
+            project_sync_dicts = sync_dicts(store_data)
+            markdown_children = project_sync_dicts.dropdown_preset(variable, dropdown_value)
+            
+            if markdown_children is None:
+                markdown_children = ", ".join(
+                    project_sync_dicts.dropdown_labels(variable, dropdown_value))
                
         if A_or_B == 'B':
             markdown_children_B = markdown_children
@@ -298,7 +1599,17 @@ class FormWithRadioitemsAndDropdown(dbc.Form):
                     markdown_children_B = markdown_children_B) 
             
     
+# Snap a rangeslider value onto the nearest radioitem preset when both of its ends lie
+# within this many rangeslider steps of the preset's. 0 only resolves exact matches.
+RANGESLIDER_SNAP_STEPS = 0
+
+# Mark the rangesliders at this many quantile intervals of the respondents' values, as 
+# given by RangeIndex.quantiles(), e.g. 4 for quartiles. 0 only marks the two endpoints.
+RANGESLIDER_QUANTILE_MARKS = 0
+
 class FormWithRadioitemsAndRangeslider(dbc.Form):
+    
+    var_type = 'R'
 
     class ids:
         
@@ -333,6 +1644,14 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
             'A_or_B' : A_or_B,            
             'variable': variable
             }
+        
+        # store set once the collapse is first opened, if lazy
+        collapse_body_request = lambda A_or_B, variable: {
+            'component': 'FormWithRadioitemsAndRangeslider',
+            'subcomponent': 'collapse_body_request',
+            'A_or_B' : A_or_B,            
+            'variable': variable
+            }
 
     ids = ids
         
@@ -341,6 +1660,8 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
         A_or_B,
         variable,
         radioitem2rangeslidervalues_dict,
+        lazy = False,
+        marks_at = None
         ):
         """FormWithRadioitemsAndRangeslider is composed of button and collapse. The button 
         opens/closes collapse, which contains radioitems and rangeslider. 
@@ -359,21 +1680,17 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
         the combination of A_or_B and variable must be unique to a given instance.       
         - radioitem2rangeslidervalues_dict: dictionary of {radioitem value: [x1,x2],
                                                            ...}
+        - lazy: bool, if True the collapse is left empty and its body is only rendered, by
+        render_collapse_body(), the first time it is opened.
+        - marks_at: list of the values to mark on the rangeslider, or None for the 
+        endpoints of 'All'.
         """
                 
         className = "text-primary" if A_or_B == "A" else "text-secondary"
-        color = className
                 
-        try:
-            rangeslider_range = radioitem2rangeslidervalues_dict['All']
-        except KeyError:
+        if 'All' not in radioitem2rangeslidervalues_dict:
             raise KeyError("radioitem2rangeslidervalues_dict does not contain a key named " +
                            "'All'. This is required to specify initial rangeslider value.")
-        
-        radioitem_options = ['All'] + [x for x in radioitem2rangeslidervalues_dict.keys()
-                                       if x != 'All']
-        
-        marks_format = '${:,}' if re.match('^[Ii]', variable) else '{}'
             
         # layout:
         super().__init__(
@@ -387,48 +1704,77 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
                     n_clicks = 0
                     ),
                 
-                dbc.Collapse(
-                    [
-                        dbc.RadioItems(
-                            id = self.ids.radioitems(A_or_B, variable),
-                            options = [
-                                {'label': i, 'value' : i}
-                                for i in radioitem_options
-                                ],
-                            value = radioitem_options[0],
-                            inline = True,
-                            labelStyle = {
-                                "font-size" : 'small',
-                                "color" : color
-                                }
-                            ),                
+                dcc.Store(
+                    id = self.ids.collapse_body_request(A_or_B, variable)
+                    ) if lazy else None,
                 
-                        dcc.RangeSlider(
-                            id = self.ids.rangeslider(A_or_B, variable),
-                            value = rangeslider_range,
-                            allowCross = False,
-                            tooltip = {
-                                'always_visible' : False, 
-                                'placement' : 'bottom'
-                                },
-                            updatemode = 'mouseup',
-                            className = "dash-bootstrap",
-                            min =  rangeslider_range[0],
-                            max = rangeslider_range[1],
-                            step = 1000 if rangeslider_range[1] > 100000 else 1,
-                            marks = {
-                                i : marks_format.format(i) 
-                                for i in rangeslider_range
-                                }
-                            )
-                        ],
+                dbc.Collapse(
+                    [] if lazy else self.collapse_body(
+                        A_or_B, variable, radioitem2rangeslidervalues_dict, marks_at),
                     id = self.ids.collapse(A_or_B, variable),
                     is_open = False
                     )        
                 ]
             )
     
-    @callback(
+    @classmethod
+    def collapse_body(cls, A_or_B, variable, radioitem2rangeslidervalues_dict, marks_at = None):
+        """Return the radioitems and rangeslider that the collapse wraps."""
+        
+        color = "text-primary" if A_or_B == "A" else "text-secondary"
+        
+        rangeslider_range = radioitem2rangeslidervalues_dict['All']
+        
+        radioitem_options = ['All'] + [x for x in radioitem2rangeslidervalues_dict.keys()
+                                       if x != 'All']
+        
+        marks_format = '${:,}' if re.match('^[Ii]', variable) else '{}'
+        
+        return [
+            dbc.RadioItems(
+                id = cls.ids.radioitems(A_or_B, variable),
+                options = [
+                    {'label': i, 'value' : i}
+                    for i in radioitem_options
+                    ],
+                value = radioitem_options[0],
+                inline = True,
+                labelStyle = {
+                    "font-size" : 'small',
+                    "color" : color
+                    }
+                ),                
+    
+            dcc.RangeSlider(
+                id = cls.ids.rangeslider(A_or_B, variable),
+                value = rangeslider_range,
+                allowCross = False,
+                tooltip = {
+                    'always_visible' : False, 
+                    'placement' : 'bottom'
+                    },
+                updatemode = 'mouseup',
+                className = "dash-bootstrap",
+                min =  rangeslider_range[0],
+                max = rangeslider_range[1],
+                step = cls.step(rangeslider_range),
+                marks = {
+                    i : marks_format.format(i) 
+                    for i in (rangeslider_range if marks_at is None else marks_at)
+                    }
+                )
+            ]
+    
+    @staticmethod
+    def step(rangeslider_range):
+        return 1000 if rangeslider_range[1] > 100000 else 1
+    
+    @staticmethod
+    def snap_tolerance(sync_dict):
+        return RANGESLIDER_SNAP_STEPS * FormWithRadioitemsAndRangeslider.step(sync_dict['All'])
+    
+    @ui_callback(
+        TOGGLE_COLLAPSE_JS,
         Output(ids.collapse(MATCH, MATCH), 'is_open'),        
         Input(ids.button(MATCH, MATCH), 'n_clicks'),
         State(ids.collapse(MATCH, MATCH), 'is_open'),
@@ -437,42 +1783,69 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
     def toggle_collapse(n_clicks, is_open):
         return not is_open
     
-    @callback(
+    @ui_callback(
+        REQUEST_COLLAPSE_BODY_JS,
+        Output(ids.collapse_body_request(MATCH, MATCH), 'data'),
+        Input(ids.button(MATCH, MATCH), 'n_clicks'),
+        prevent_initial_call = True,
+        enabled = LAZY_FILTER_MENUS
+        )
+    def request_collapse_body(n_clicks):
+        return True if n_clicks == 1 else no_update
+    
+    @callback_if(
+        LAZY_FILTER_MENUS,
+        Output(ids.collapse(MATCH, MATCH), 'children'),
+        Input(ids.collapse_body_request(MATCH, MATCH), 'data'),
+        sync_dicts_state(MATCH),
+        State('Dropdown-SelectedProject', 'value'),
+        prevent_initial_call = True
+        )
+    def render_collapse_body(collapse_body_request, store_data, selected_project):
+        collapse_id = callback_context.outputs_list['id']
+        variable = collapse_id['variable']
+        sync_dict = sync_dicts(store_data)[variable]
+        return FormWithRadioitemsAndRangeslider.collapse_body(
+            collapse_id['A_or_B'], variable, sync_dict, 
+            rangeslider_marks_at(selected_project, variable, sync_dict))
+    
+    @ui_callback(
+        SYNC_RADIOITEMS_AND_RANGESLIDER_JS % dict(snap_steps = RANGESLIDER_SNAP_STEPS),
         Output(ids.rangeslider(MATCH, MATCH), 'value'),        
         Output(ids.radioitems(MATCH, MATCH), 'value'),
         
         Input(ids.radioitems(MATCH, MATCH), 'value'),
         Input(ids.rangeslider(MATCH, MATCH), 'value'),
         
-        State('Store-ProjectVariableSyncDicts', 'data'),        
-        prevent_initial_call = True
+        sync_dicts_state(MATCH),        
+        prevent_initial_call = True,
+        clientside = CLIENTSIDE_SYNC_CALLBACKS and SYNC_STORE_MODE != 'registry'
         )
     def sync_radioitems_and_rangelsider(radioitems_value, rangeslider_value, store_data):
         ctx = callback_context
         trigger_id_dict = list(ctx.triggered_prop_ids.values())[0]
-        sync_dict = json.loads(store_data)[trigger_id_dict['variable']]
+        project_sync_dicts = sync_dicts(store_data)
+        variable = trigger_id_dict['variable']
+        sync_dict = project_sync_dicts[variable]
         
         if trigger_id_dict['subcomponent'] == 'radioitems':
             rangeslider_value = sync_dict[radioitems_value]
         
         else: 
-            for k, v in sync_dict.items():
-                if v == rangeslider_value:
-                    radioitems_value = k
-                    break
-            else:
-                radioitems_value = None
+            radioitems_value, rangeslider_value = project_sync_dicts.rangeslider_preset(
+                variable, rangeslider_value, FormWithRadioitemsAndRangeslider.snap_tolerance(sync_dict))
             
         return rangeslider_value, radioitems_value
 
-    @callback(
+    @callback_if(
+        not FILTER_STATE_STORE,
         output = dict(
             markdown_children_A = Output(MarkdownInFilterFooter.ids.markdown_value('A', 'R', MATCH), 'children'),
             markdown_children_B = Output(MarkdownInFilterFooter.ids.markdown_value('B', 'R', MATCH), 'children')
             ),
         inputs = dict(
             rangeslider_value = Input(ids.rangeslider(ALL, MATCH), 'value'),
-            store_data = State('Store-ProjectVariableSyncDicts', 'data'),
+            store_data = sync_dicts_state(MATCH),
             not_audience_A = State({'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value'),
             ),
         prevent_initial_call = True,
@@ -485,13 +1858,13 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
         store_data = callback_context.args_grouping.store_data['value']
         not_audience_A = callback_context.args_grouping.not_audience_A['value']
        
-        sync_dict = json.loads(store_data)[variable]
+        project_sync_dicts = sync_dicts(store_data)
         
-        for k, v in sync_dict.items():
-            if v == rangeslider_value:
-                markdown_children = k
-                break
-        else:
+        markdown_children, _ = project_sync_dicts.rangeslider_preset(
+            variable, rangeslider_value, 
+            FormWithRadioitemsAndRangeslider.snap_tolerance(project_sync_dicts[variable]))
+        
+        if markdown_children is None:
             markdown_children = "{:,} - {:,}".format(
                 rangeslider_value[0], rangeslider_value[1])
                
@@ -506,8 +1879,11 @@ class FormWithRadioitemsAndRangeslider(dbc.Form):
                     markdown_children_B = markdown_children_B) 
 
 
+startup_phase('components and their callbacks')
+
+
 ############################################################################### 
-# 2. Function to build a filter menu
+# 3. Function to build a filter menu
 ###############################################################################
 
 def card_filtermenu(A_or_B):
@@ -627,7 +2003,8 @@ def card_filtermenu(A_or_B):
         )
 
 
-@callback(
+@ui_callback(
+    EXPAND_OR_COLLAPSE_FILTERMENU_JS,
     Output({'component' : 'Collapse-FilterOptions', 'A_or_B' : MATCH}, 'is_open'),
     Output({'component' : 'Button-OpenFilterOptions', 'A_or_B' : MATCH}, 'disabled'),
     Input({'component' : 'Button-OpenFilterOptions', 'A_or_B' : MATCH}, 'n_clicks'),
@@ -643,100 +2020,961 @@ def expand_or_collapse_filtermenu(button, checkbox, is_open):
         return False, not checkbox
 
 
-# below callback is origin of the error: "Overlapping wildcard callback outputs"
-# I have commented it out so you can first run this example app successfully.
-# @callback(
-#     output = dict(
-#         discrete_variable_buttons = Output(
-#             FormWithRadioitemsAndDropdown.ids.button(MATCH, ALL), 'disabled'
-#             ),
-#         numeric_variable_buttons = Output(
-#             FormWithRadioitemsAndRangeslider.ids.button(MATCH, ALL), 'disabled'
-#             ),
-#         markdown_values_B = Output(
-#             MarkdownInFilterFooter.ids.markdown_value(MATCH, ALL, ALL), 'children'
-#             )
-#         ),
-#     inputs = dict(
-#         not_audience_A = Input(
-#             {'component' : 'Checkbox-NotAudienceA', 'A_or_B' : MATCH}, 'value'
-#             ),
-#         markdown_values_A = State(
-#             MarkdownInFilterFooter.ids.markdown_value('A', ALL, ALL), 'children'
-#             )
-#         ),
-#     prevent_initial_call = True,
-#     allow_duplicate = True
-#     )
-# def if_not_audience_A_checked(
-#         not_audience_A, 
-#         markdown_values_A):
-    
-#     # the below is just placeholder code to indicate the gist of what I want:
-#     # if the 'Not Audience A' checkbutton is checked, I want to update all
-#     # Audience B markdown components to reference the values of the Audience A 
-#     # markdown components.
-    
-#     if not_audience_A:
-#         markdown_values_B = list(map(lambda value: f'NOT {value}', markdown_values_A))
-#     else:
-#         markdown_values_B = no_update
-    
-#     return dict(
-#         discrete_variable_buttons = not not_audience_A,
-#         numeric_variable_buttons = not not_audience_A,
-#         markdown_values_B = markdown_values_B
-#         )
+# The callback below updates every Audience B markdown value when the 'Not Audience A'
+# checkbox is toggled, in a single request whatever the number of variables. Writing to
+# MarkdownInFilterFooter.ids.markdown_value(MATCH, ALL, ALL) directly raises 
+# "Overlapping wildcard callback outputs", because the markdown_children_update() methods
+# write to the same markdowns through MATCH. Instead, it patches the children of the 
+# Audience B card footer that holds them, which no wildcard output covers, so it coexists
+# with the per-variable callbacks. Note that allow_duplicate must be passed to Output(),
+# not to callback(). The form buttons' 'disabled' is written by no other callback.
+@callback(
+    output = dict(
+        filterfooter_B = Output(
+            {'component' : 'CardFooter-FilterSummaries', 'A_or_B' : 'B'}, 'children',
+            allow_duplicate = True
+            ),
+        summaries_B = Output('Store-AudienceBSummaries', 'data', allow_duplicate = True),
+        filter_state = Output('Store-FilterState', 'data', allow_duplicate = True),
+        dropdown_buttons = Output(
+            FormWithRadioitemsAndDropdown.ids.button('B', ALL), 'disabled'
+            ),
+        searchable_dropdown_buttons = Output(
+            FormWithRadioitemsAndSearchableDropdown.ids.button('B', ALL), 'disabled'
+            ),
+        rangeslider_buttons = Output(
+            FormWithRadioitemsAndRangeslider.ids.button('B', ALL), 'disabled'
+            )
+        ),
+    inputs = dict(
+        not_audience_A = Input(
+            {'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value'
+            ),
+        markdown_values_A = State(
+            MarkdownInFilterFooter.ids.markdown_value('A', ALL, ALL), 'children'
+            ),
+        markdown_values_B = State(
+            MarkdownInFilterFooter.ids.markdown_value('B', ALL, ALL), 'children'
+            ),
+        summaries_B = State('Store-AudienceBSummaries', 'data')
+        ),
+    prevent_initial_call = True
+    )
+def if_not_audience_A_checked(
+        not_audience_A, 
+        markdown_values_A,
+        markdown_values_B,
+        summaries_B):
+    
+    # If checked, every Audience B markdown shows the inverse of its Audience A 
+    # counterpart and the Audience B forms are disabled. Audience B's own summaries are 
+    # kept in 'Store-AudienceBSummaries' and restored once unchecked.
+    
+    if not_audience_A:
+        summaries_B = markdown_values_B
+        markdown_values = [f'NOT {value}' for value in markdown_values_A]
+    else:
+        markdown_values = summaries_B or markdown_values_B
+        summaries_B = None
+    
+    # the footer holds a name and a value markdown per variable, in the same order as the
+    # markdown values matched by ALL
+    filterfooter_B = Patch()
+    for i, value in enumerate(markdown_values):
+        filterfooter_B[2 * i + 1]['props']['children'] = value
+        # markdown_value_color_update() does not fire for patched children
+        filterfooter_B[2 * i + 1]['props']['className'] = "" if value == "All" else "text-info"
+    
+    buttons = callback_context.outputs_grouping
+    disabled = bool(not_audience_A)
+    
+    if FILTER_STATE_STORE:
+        filter_state = Patch()
+        filter_state['not_audience_A'] = disabled
+    else:
+        filter_state = no_update
+    
+    return dict(
+        filterfooter_B = filterfooter_B,
+        summaries_B = summaries_B,
+        filter_state = filter_state,
+        dropdown_buttons = [disabled] * len(buttons['dropdown_buttons']),
+        searchable_dropdown_buttons = [disabled] * len(buttons['searchable_dropdown_buttons']),
+        rangeslider_buttons = [disabled] * len(buttons['rangeslider_buttons'])
+        )
+
+
+def filter_state(definition, not_audience_A = False):
+    """
+    Return the initial filter state of a project: 
+        {'A': {variable: {'value': None, 'preset': 'All'}, ...},
+         'B': {...},
+         'not_audience_A': not_audience_A}
+    where a value of None means the values of the preset, as in resolve_filter(), and 
+    not_audience_A is the value of the 'Not Audience A' checkbox.
+    """
+    variables = [*definition['D'], *definition['R']]
+    return {
+        **{
+            A_or_B : {variable : {'value' : None, 'preset' : 'All'} for variable in variables}
+            for A_or_B in ['A', 'B']
+            },
+        'not_audience_A' : bool(not_audience_A)
+        }
 
+def resolve_filter(project_sync_dicts, var_type, variable, entry):
+    """
+    Return the dropdown values (for var_type 'D' or 'S') or [x1,x2] (for 'R') selected by
+    entry, a {'value': ..., 'preset': ...} of the filter state.
+    """
+    sync_dict = project_sync_dicts[variable]
+    value, preset = entry['value'], entry['preset']
+    if value is None or (var_type == 'S' and not value):
+        return sync_dict[preset] if preset is not None else []
+    if var_type == 'R':
+        return value
+    return project_sync_dicts.dropdown_labels(variable, value)
 
-############################################################################### 
-# 3. Layout
-###############################################################################
+def filter_summary(project_sync_dicts, var_type, variable, entry):
+    """Return the footer markdown text for entry, as markdown_children_update() renders it."""
+    if var_type == 'R':
+        rangeslider_value = resolve_filter(project_sync_dicts, var_type, variable, entry)
+        preset, _ = project_sync_dicts.rangeslider_preset(
+            variable, rangeslider_value, 
+            FormWithRadioitemsAndRangeslider.snap_tolerance(project_sync_dicts[variable]))
+        return preset if preset is not None else "{:,} - {:,}".format(*rangeslider_value)
+    
+    if entry['value'] is None or (var_type == 'S' and not entry['value']):
+        return entry['preset'] if entry['preset'] is not None else "-"
+    if not entry['value']:
+        return "-"
+    preset = project_sync_dicts.dropdown_preset(variable, entry['value'])
+    if preset is not None:
+        return preset
+    return ", ".join(project_sync_dicts.dropdown_labels(variable, entry['value']))
 
-FILTER_MENUS = dbc.Row(
-    [
-        dbc.Col(
-            card_filtermenu('A'), 
-            width = 6
-            ),
-        dbc.Col(
-            card_filtermenu('B'), 
-            width = 6
-            ),
-        ], 
-    className = "g-0"
+@ui_callback(
+    FILTER_STATE_DELTA_JS,
+    Output('Store-FilterStateDelta', 'data'),
+    Input(FormWithRadioitemsAndDropdown.ids.dropdown(ALL, ALL), 'value'),
+    Input(FormWithRadioitemsAndDropdown.ids.radioitems(ALL, ALL), 'value'),
+    Input(FormWithRadioitemsAndSearchableDropdown.ids.dropdown(ALL, ALL), 'value'),
+    Input(FormWithRadioitemsAndSearchableDropdown.ids.radioitems(ALL, ALL), 'value'),
+    Input(FormWithRadioitemsAndRangeslider.ids.rangeslider(ALL, ALL), 'value'),
+    Input(FormWithRadioitemsAndRangeslider.ids.radioitems(ALL, ALL), 'value'),
+    prevent_initial_call = True,
+    # always in the browser, whatever CLIENTSIDE_UI_CALLBACKS: on the server, every move 
+    # would upload the values of all the forms, to send back the delta of one
+    clientside = True,
+    enabled = FILTER_STATE_STORE
     )
+def filter_state_delta(dropdown_D, radioitems_D, dropdown_S, radioitems_S, rangeslider_R, radioitems_R):
+    # one delta per form that changed, carrying only that form's value and preset. In the 
+    # browser, this uploads nothing.
+    ctx = callback_context
+    triggered = {(x['A_or_B'], x['variable']) for x in ctx.triggered_prop_ids.values()}
+    deltas = []
+    for g, var_type in enumerate(['D', 'S', 'R']):
+        presets = {(x['id']['A_or_B'], x['id']['variable']) : x.get('value')
+                   for x in ctx.inputs_list[2 * g + 1]}
+        for x in ctx.inputs_list[2 * g]:
+            key = (x['id']['A_or_B'], x['id']['variable'])
+            if key in triggered:
+                deltas.append(dict(
+                    A_or_B = key[0],
+                    var_type = var_type,
+                    variable = key[1],
+                    value = x.get('value'),
+                    preset = presets.get(key)
+                    ))
+    return deltas or no_update
 
-app.layout = dbc.Container(
-    [
-        dbc.Row(
-            dbc.Col(
-                dcc.Dropdown(
-                    id = 'Dropdown-SelectedProject',
-                    options = [
-                        dict(label=project_name, value=project_name)
-                        for project_name in ['Project 1']
-                        ],
-                    value = 'Project 1',
-                    multi = False,
-                    clearable = False,
+@callback_if(
+    FILTER_STATE_STORE,
+    Output('Store-FilterState', 'data', allow_duplicate = True),
+    Output({'component' : 'CardFooter-FilterSummaries', 'A_or_B' : 'A'}, 'children', 
+           allow_duplicate = True),
+    Output({'component' : 'CardFooter-FilterSummaries', 'A_or_B' : 'B'}, 'children', 
+           allow_duplicate = True),
+    Input('Store-FilterStateDelta', 'data'),
+    State('Dropdown-SelectedProject', 'value'),
+    State({'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value'),
+    prevent_initial_call = True
+    )
+def apply_filter_state_delta(deltas, selected_project, not_audience_A):
+    # Neither the filter state nor the sync dicts are uploaded: the request carries the 
+    # deltas only and the response patches only the changed entries and markdowns.
+    project_sync_dicts = sync_dicts_of_project(selected_project)
+    variables = list(project_sync_dicts)
+    
+    filter_state = Patch()
+    filterfooters = {'A' : Patch(), 'B' : Patch()}
+    for delta in deltas:
+        A_or_B, var_type, variable = delta['A_or_B'], delta['var_type'], delta['variable']
+        entry = {'value' : delta['value'], 'preset' : delta['preset']}
+        filter_state[A_or_B][variable] = entry
+        
+        summary = filter_summary(project_sync_dicts, var_type, variable, entry)
+        # the footer holds a name and a value markdown per variable, in definition order
+        i = 2 * variables.index(variable) + 1
+        summaries = {A_or_B : summary}
+        if A_or_B == 'A' and not_audience_A:
+            summaries['B'] = 'NOT ' + summary
+        for k, v in summaries.items():
+            filterfooters[k][i]['props']['children'] = v
+            filterfooters[k][i]['props']['className'] = "" if v == "All" else "text-info"
+    
+    return filter_state, filterfooters['A'], filterfooters['B']
+
+
+class ProjectDataStore:
+    
+    def __init__(self, directory):
+        """
+        Columnar on-disk storage of project respondent tables: a directory per project
+        holding a .npy file per variable, opened memory-mapped and read-only. Columns are
+        written atomically, so workers sharing directory never map a partial file.
+        
+        - directory: string, path of the directory shared by the workers.
+        """
+        self.directory = directory
+    
+    def path(self, project, variable):
+        # project comes back from the browser, so keep it from escaping self.directory
+        if project in ('.', '..'):
+            raise KeyError(f"Invalid project {project!r}.")
+        return os.path.join(
+            self.directory, quote(project, safe = ''), quote(variable, safe = '') + '.npy')
+    
+    def write(self, project, table):
+        """Write table, a dictionary of {variable: column}, as the data of project."""
+        for variable, column in table.items():
+            atomic_write(self.path(project, variable), lambda f: np.save(f, column))
+    
+    def open(self, project, variables):
+        """
+        Return {variable: read-only memory-mapped column} of project for variables, or 
+        None if any of them has not been written.
+        """
+        try:
+            return {
+                variable : np.load(self.path(project, variable), mmap_mode = 'r')
+                for variable in variables
+                }
+        except FileNotFoundError:
+            return None
+
+
+# Directory shared by the WSGI workers of a host, used when MMAP_PROJECT_DATA.
+PROJECT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'filter_menu_projects')
+
+PROJECT_DATA = ProjectDataStore(PROJECT_DATA_DIR)
+
+
+class RangeIndex:
+    
+    def __init__(self, column):
+        """
+        The values of a rangeslider variable sorted once, with the permutation that sorts
+        them, so that the respondents within [x1, x2] are a contiguous run of the sorted 
+        values, found by two binary searches.
+        
+        - column: 1-d array, the values of the variable, one per respondent.
+        """
+        self.order = np.argsort(column, kind = 'stable')
+        self.values = column[self.order]
+        self.nbytes = self.order.nbytes + self.values.nbytes
+    
+    def bound(self, x, side):
+        """
+        Return x as a scalar of the dtype of the values, so that searchsorted() compares
+        without casting the whole array. For an integer dtype, x1 is rounded up and x2 
+        down, and both are clipped to the range of the dtype.
+        """
+        dtype = self.values.dtype
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            x = math.ceil(x) if side == 'left' else math.floor(x)
+            x = min(max(x, int(info.min)), int(info.max))
+        return dtype.type(x)
+    
+    def bounds(self, x1, x2):
+        """Return the slice of the sorted values lying within [x1, x2]."""
+        return slice(
+            int(np.searchsorted(self.values, self.bound(x1, 'left'), side = 'left')),
+            int(np.searchsorted(self.values, self.bound(x2, 'right'), side = 'right'))
+            )
+    
+    def count(self, x1, x2):
+        """Return the number of respondents whose value lies within [x1, x2]."""
+        run = self.bounds(x1, x2)
+        return run.stop - run.start
+    
+    def rows(self, x1, x2):
+        """Return the positions in the table of the respondents whose value lies within [x1, x2]."""
+        return self.order[self.bounds(x1, x2)]
+    
+    def quantiles(self, k, step = 1):
+        """Return the distinct k-quantiles of the values, rounded to multiples of step."""
+        if not len(self.values):
+            return []
+        positions = np.linspace(0, len(self.values) - 1, k + 1).round().astype(np.int64)
+        quantiles = (self.values[positions] / step).round() * step
+        return sorted({int(x) for x in quantiles})
+
+
+# Number of recent selections kept per variable by a BitmapIndex, and bound on the bytes
+# of their bitmaps (one byte per respondent each) across the variables of an index.
+BITMAP_INDEX_RECENT_SELECTIONS = 16
+BITMAP_INDEX_RECENT_MAXBYTES = 64 * 2**20
+
+class BitmapIndex:
+    
+    def __init__(self, table, project_sync_dicts, variables):
+        """
+        The rows of the respondents having each value of each dropdown variable, built in 
+        one pass per variable: the positions of the column are sorted by value (a stable 
+        argsort), so the rows of the value at position p are the run 
+        order[starts[p]:starts[p + 1]], with the run boundaries counted by np.bincount. 
+        This takes one row number per respondent per variable, whatever the number of 
+        values.
+        
+        The bitmap (boolean mask) of a selection is built by setting the rows of its 
+        values. A respondent has exactly one value of a variable, so the row sets of a 
+        variable are disjoint: the bitmap of a selection can be derived from that of any 
+        other selection of the variable by setting the rows of added values and clearing
+        those of removed values. The most recent selections of each variable are kept, 
+        and a new selection starts from whichever has the fewest rows to change. They are
+        bounded by BITMAP_INDEX_RECENT_MAXBYTES as well as by number, and that bound is 
+        counted in nbytes, so that AUDIENCE_ENGINE_CACHE sees the full footprint.
+        
+        - table: dictionary of {variable: column}, as taken by AudienceEngine.
+        - project_sync_dicts: ProjectSyncDicts of the project.
+        - variables: list of the dropdown variables to index.
+        """
+        self.n = len(next(iter(table.values()))) if table else 0
+        row_dtype = np.int32 if self.n < 2**31 else np.int64
+        self.orders = {}
+        self.starts = {}
+        for variable in variables:
+            column = table[variable]
+            counts = np.bincount(column, minlength = len(project_sync_dicts[variable]['All']))
+            self.orders[variable] = np.argsort(column, kind = 'stable').astype(row_dtype)
+            self.starts[variable] = np.concatenate(([0], np.cumsum(counts)))
+        self.recent_capacity = min(
+            BITMAP_INDEX_RECENT_SELECTIONS * len(variables), 
+            BITMAP_INDEX_RECENT_MAXBYTES // max(self.n, 1))
+        self.nbytes = sum(
+            self.orders[variable].nbytes + self.starts[variable].nbytes 
+            for variable in variables) + self.recent_capacity * self.n
+        self._recent = {variable : OrderedDict() for variable in variables}
+        self._recent_order = OrderedDict() # (variable, selection) -> None, oldest first
+        self._lock = threading.Lock()
+    
+    def rows(self, variable, p):
+        """Return the rows of the respondents having the value at position p of variable."""
+        starts = self.starts[variable]
+        return self.orders[variable][starts[p]:starts[p + 1]]
+    
+    def row_count(self, variable, positions):
+        """Return the number of respondents having any of the values at positions."""
+        starts = self.starts[variable]
+        return sum(int(starts[p + 1] - starts[p]) for p in positions)
+    
+    def variable_bitmap(self, variable, positions):
+        """Return the bitmap of the respondents having any of the values at positions."""
+        key = frozenset(positions)
+        recent = self._recent[variable]
+        with self._lock:
+            bitmap = recent.get(key)
+            if bitmap is not None:
+                recent.move_to_end(key)
+                self._recent_order.move_to_end((variable, key))
+                return bitmap
+            base_key, base = min(
+                recent.items(), key = lambda x: self.row_count(variable, x[0] ^ key), 
+                default = (frozenset(), None))
+        
+        if base is None or self.row_count(variable, base_key ^ key) > self.row_count(variable, key):
+            base_key = frozenset()
+            bitmap = np.zeros(self.n, dtype = bool)
+        else:
+            bitmap = base.copy()
+        for p in key - base_key:
+            bitmap[self.rows(variable, p)] = True
+        for p in base_key - key:
+            bitmap[self.rows(variable, p)] = False
+        
+        with self._lock:
+            if self.recent_capacity and key not in recent:
+                recent[key] = bitmap
+                self._recent_order[(variable, key)] = None
+                if len(recent) > BITMAP_INDEX_RECENT_SELECTIONS:
+                    del self._recent_order[(variable, recent.popitem(last = False)[0])]
+                while len(self._recent_order) > self.recent_capacity:
+                    evicted_variable, evicted_key = self._recent_order.popitem(last = False)[0]
+                    del self._recent[evicted_variable][evicted_key]
+        return bitmap
+
+
+class AudienceEngine:
+    
+    def __init__(self, table, definition):
+        """
+        Evaluates the audiences of a project over its respondent table, one column at a
+        time with NumPy, so that no Python code runs per respondent.
+        
+        - table: dictionary of {variable: 1-d array}, one column per variable of 
+            definition, all of the same length. The column of a dropdown variable holds 
+            positions in its 'All' list; that of a rangeslider variable, the values.
+        - definition: dictionary, the filter menu definition of the project, as returned 
+            by project_definition().
+        """
+        self.table = table
+        self.n = len(next(iter(table.values()))) if table else 0
+        # memory-mapped columns live in the page cache, not in this worker's heap
+        self.nbytes = sum(
+            column.nbytes for column in table.values() if not isinstance(column, np.memmap))
+        self.project_sync_dicts = ProjectSyncDicts({**definition['D'], **definition['R']})
+        self.var_types = {
+            **{variable : dropdown_form_class(radioitem2dropdownvalues_dict).var_type
+               for variable, radioitem2dropdownvalues_dict in definition['D'].items()},
+            **{variable : FormWithRadioitemsAndRangeslider.var_type 
+               for variable in definition['R']}
+            }
+        if AUDIENCE_BITMAP_INDEX:
+            self.bitmap_index = BitmapIndex(table, self.project_sync_dicts, list(definition['D']))
+            self.nbytes += self.bitmap_index.nbytes
+        else:
+            self.bitmap_index = None
+        if AUDIENCE_RANGE_INDEX or RANGESLIDER_QUANTILE_MARKS:
+            self.range_indexes = {
+                variable : RangeIndex(table[variable]) for variable in definition['R']
+                }
+            self.nbytes += sum(index.nbytes for index in self.range_indexes.values())
+        else:
+            self.range_indexes = {}
+    
+    def selected_positions(self, variable, entry):
+        """Return the positions in 'All' of the dropdown values selected by entry."""
+        selection = resolve_filter(self.project_sync_dicts, self.var_types[variable], variable, entry)
+        positions = self.project_sync_dicts.dropdown_positions(variable)
+        return [positions[v] for v in selection]
+    
+    def variable_mask(self, variable, entry):
+        """Return the boolean mask of the respondents selected by entry of the filter state."""
+        column = self.table[variable]
+        if self.var_types[variable] == 'R':
+            x1, x2 = resolve_filter(self.project_sync_dicts, 'R', variable, entry)
+            # a full mask is cheaper to scan for than to scatter from the RangeIndex
+            return (column >= x1) & (column <= x2)
+        
+        # a lookup table over the variable's positions, indexed by the whole column
+        selected = np.zeros(len(self.project_sync_dicts[variable]['All']), dtype = bool)
+        selected[self.selected_positions(variable, entry)] = True
+        return selected[column]
+    
+    def audience_mask(self, filters):
+        """Return the boolean mask of the respondents selected by every entry of filters."""
+        mask = np.ones(self.n, dtype = bool)
+        for variable, entry in filters.items():
+            if entry['value'] is None and entry['preset'] == 'All':
+                continue
+            mask &= self.variable_mask(variable, entry)
+        return mask
+    
+    def audience_bitmap(self, filters):
+        """
+        Return the bitmap of the respondents selected by every entry of filters, the AND
+        of the bitmaps of the BitmapIndex for dropdown variables, or None if no entry 
+        filters anyone out.
+        """
+        bitmap = None
+        for variable, entry in filters.items():
+            if entry['value'] is None and entry['preset'] == 'All':
+                continue
+            if self.var_types[variable] == 'R':
+                variable_bitmap = self.variable_mask(variable, entry)
+            else:
+                variable_bitmap = self.bitmap_index.variable_bitmap(
+                    variable, self.selected_positions(variable, entry))
+            if bitmap is None:
+                bitmap = variable_bitmap.copy()
+            else:
+                bitmap &= variable_bitmap
+        return bitmap
+    
+    def audience_count(self, filters):
+        """
+        Return the size of the audience selected by filters, counted from the RangeIndex
+        when a single rangeslider variable filters anyone out, or None if the audience 
+        needs a mask.
+        """
+        active = [(variable, entry) for variable, entry in filters.items()
+                  if not (entry['value'] is None and entry['preset'] == 'All')]
+        if not active:
+            return self.n
+        if len(active) == 1 and AUDIENCE_RANGE_INDEX:
+            variable, entry = active[0]
+            if self.var_types[variable] == 'R':
+                x1, x2 = resolve_filter(self.project_sync_dicts, 'R', variable, entry)
+                return self.range_indexes[variable].count(x1, x2)
+        return None
+    
+    def sizes(self, filter_state):
+        """
+        Return {'A': size, 'B': size} for filter_state, as evaluate() does, without 
+        building the masks that audience_count() can do without.
+        """
+        size_A = self.audience_count(filter_state['A'])
+        if filter_state.get('not_audience_A'):
+            size_B = None if size_A is None else self.n - size_A
+        else:
+            size_B = self.audience_count(filter_state['B'])
+        if size_A is None or size_B is None:
+            return self.evaluate(filter_state)[1]
+        return {'A' : size_A, 'B' : size_B}
+    
+    def evaluate(self, filter_state):
+        """
+        Return ({'A': mask, 'B': mask}, {'A': size, 'B': size}) for filter_state, as kept 
+        in 'Store-FilterState'. If 'not_audience_A' is set, Audience B is the complement
+        of Audience A and its own filters are ignored, as its forms are disabled.
+        """
+        if self.bitmap_index is not None:
+            return self._evaluate_bitmaps(filter_state)
+        
+        mask_A = self.audience_mask(filter_state['A'])
+        if filter_state.get('not_audience_A'):
+            mask_B = ~mask_A
+        else:
+            mask_B = self.audience_mask(filter_state['B'])
+        masks = {'A' : mask_A, 'B' : mask_B}
+        return masks, {A_or_B : int(np.count_nonzero(mask)) for A_or_B, mask in masks.items()}
+    
+    def _evaluate_bitmaps(self, filter_state):
+        def mask(bitmap):
+            return np.ones(self.n, dtype = bool) if bitmap is None else bitmap
+        
+        mask_A = mask(self.audience_bitmap(filter_state['A']))
+        if filter_state.get('not_audience_A'):
+            mask_B = ~mask_A
+        else:
+            mask_B = mask(self.audience_bitmap(filter_state['B']))
+        masks = {'A' : mask_A, 'B' : mask_B}
+        return masks, {A_or_B : int(np.count_nonzero(mask)) for A_or_B, mask in masks.items()}
+
+
+# Bounds for AUDIENCE_ENGINE_CACHE, measured on the respondent tables.
+AUDIENCE_ENGINE_CACHE_MAXSIZE = 8
+AUDIENCE_ENGINE_CACHE_MAXBYTES = 1024 * 2**20
+
+AUDIENCE_ENGINE_CACHE = LRUCache(AUDIENCE_ENGINE_CACHE_MAXSIZE, AUDIENCE_ENGINE_CACHE_MAXBYTES)
+
+# (project, engine) of the last AudienceEngine too large for AUDIENCE_ENGINE_CACHE, kept
+# on its own so that such a project is not rebuilt on every query.
+OVERSIZED_AUDIENCE_ENGINE = (None, None)
+
+def audience_engine(project):
+    """
+    Return the AudienceEngine of project, memoized in AUDIENCE_ENGINE_CACHE, or in
+    OVERSIZED_AUDIENCE_ENGINE if larger than AUDIENCE_ENGINE_CACHE_MAXBYTES.
+    """
+    global OVERSIZED_AUDIENCE_ENGINE
+    oversized_project, engine = OVERSIZED_AUDIENCE_ENGINE
+    if oversized_project == project:
+        return engine
+    engine = AUDIENCE_ENGINE_CACHE.lookup(project)
+    if engine is None:
+        engine = AudienceEngine(project_respondents(project), project_definition(project))
+        if engine.nbytes > AUDIENCE_ENGINE_CACHE.maxbytes:
+            warnings.warn(
+                f"The AudienceEngine of project {project!r} takes {engine.nbytes:,} bytes, " +
+                f"more than AUDIENCE_ENGINE_CACHE_MAXBYTES ({AUDIENCE_ENGINE_CACHE.maxbytes:,}); " +
+                "it is kept outside AUDIENCE_ENGINE_CACHE, one project at a time.")
+            OVERSIZED_AUDIENCE_ENGINE = (project, engine)
+        else:
+            AUDIENCE_ENGINE_CACHE.put(project, engine, engine.nbytes)
+    return engine
+
+def rangeslider_marks_at(project, variable, radioitem2rangeslidervalues_dict):
+    """
+    Return the values to mark on the rangeslider of variable in project: its quantiles, 
+    with RANGESLIDER_QUANTILE_MARKS, and the endpoints of 'All', or None for the endpoints
+    only.
+    """
+    if not RANGESLIDER_QUANTILE_MARKS:
+        return None
+    rangeslider_range = radioitem2rangeslidervalues_dict['All']
+    quantiles = audience_engine(project).range_indexes[variable].quantiles(
+        RANGESLIDER_QUANTILE_MARKS, FormWithRadioitemsAndRangeslider.step(rangeslider_range))
+    return sorted(
+        {*rangeslider_range, 
+         *(x for x in quantiles if rangeslider_range[0] < x < rangeslider_range[1])})
+
+def audience_size(size, n):
+    """Return the footer markdown text for an audience of size out of n respondents."""
+    share = size / n if n else 0
+    return f"**&nbsp;n:&nbsp;**{size:,} ({share:.0%})"
+
+@callback_if(
+    AUDIENCE_COUNTS and FILTER_STATE_STORE,
+    Output({'component' : 'Markdown-AudienceSize', 'A_or_B' : 'A'}, 'children'),
+    Output({'component' : 'Markdown-AudienceSize', 'A_or_B' : 'B'}, 'children'),
+    Input('Store-FilterState', 'data'),
+    State('Dropdown-SelectedProject', 'value'),
+    prevent_initial_call = True,
+    **background_kwargs(
+        BACKGROUND_AUDIENCE_COUNTS,
+        running = [
+            (Output({'component' : 'Spinner-AudienceSize', 'A_or_B' : A_or_B}, 'style'),
+             {'display' : 'inline-block'}, 
+             {'display' : 'none'})
+            for A_or_B in ['A', 'B']
+            ],
+        cancel = [Input('Dropdown-SelectedProject', 'value')]
+        )
+    )
+def audience_sizes_update(filter_state, selected_project):
+    if filter_state is None:
+        return no_update, no_update
+    engine = audience_engine(selected_project)
+    sizes = engine.sizes(filter_state)
+    return audience_size(sizes['A'], engine.n), audience_size(sizes['B'], engine.n)
+
+
+# Bounds for LAYOUT_CACHE, measured on the serialized layouts.
+LAYOUT_CACHE_MAXSIZE = 64
+LAYOUT_CACHE_MAXBYTES = 256 * 2**20
+
+LAYOUT_CACHE = LRUCache(LAYOUT_CACHE_MAXSIZE, LAYOUT_CACHE_MAXBYTES)
+
+def dropdown_form_class(radioitem2dropdownvalues_dict):
+    """Return the form class that a dropdown variable with radioitem2dropdownvalues_dict is built with."""
+    if FormWithRadioitemsAndSearchableDropdown.is_searchable(radioitem2dropdownvalues_dict):
+        return FormWithRadioitemsAndSearchableDropdown
+    return FormWithRadioitemsAndDropdown
+
+def filtermenu_components(A_or_B, definition, marks_at = None):
+    """
+    Return the forms that populate the body of the filter menu of A_or_B.
+    
+    - A_or_B: string, denotes whether the components belong to the filter menu of 
+        Audience A or Audience B.
+    - definition: dictionary of {'D': {variable: radioitem2dropdownvalues_dict, ...},
+                                 'R': {variable: radioitem2rangeslidervalues_dict, ...}}
+    - marks_at: dictionary of {variable: values to mark on its rangeslider}, for the 
+        rangeslider variables not marked at their endpoints only.
+    """
+    marks_at = marks_at or {}
+    return [
+        dropdown_form_class(radioitem2dropdownvalues_dict)(
+            A_or_B,
+            variable,
+            radioitem2dropdownvalues_dict,
+            lazy = LAZY_FILTER_MENUS
+            )
+        for variable, radioitem2dropdownvalues_dict in definition['D'].items()
+        ] + [
+        FormWithRadioitemsAndRangeslider(
+            A_or_B,
+            variable,
+            radioitem2rangeslidervalues_dict,
+            lazy = LAZY_FILTER_MENUS,
+            marks_at = marks_at.get(variable)
+            )
+        for variable, radioitem2rangeslidervalues_dict in definition['R'].items()
+        ]
+
+def filterfooter_components(A_or_B, definition):
+    """Return the name and value markdowns that populate the footer of the filter menu of A_or_B."""
+    var_types = [
+        (dropdown_form_class(radioitem2dropdownvalues_dict).var_type, variable)
+        for variable, radioitem2dropdownvalues_dict in definition['D'].items()
+        ] + [
+        (FormWithRadioitemsAndRangeslider.var_type, variable)
+        for variable in definition['R']
+        ]
+    components = [
+        MarkdownInFilterFooter(
+            A_or_B,
+            var_type,
+            variable,
+            name_or_value
+            )
+        for var_type, variable in var_types
+        for name_or_value in ['name', 'value']
+        ]
+    # after the markdowns of the variables, so that their positions are unchanged
+    if AUDIENCE_COUNTS:
+        components.append(
+            dcc.Markdown(
+                "",
+                id = {'component' : 'Markdown-AudienceSize', 'A_or_B' : A_or_B},
+                className = "text-primary" if A_or_B == "A" else "text-secondary",
+                style = {"height" : "1rem"}
+                )
+            )
+        if BACKGROUND_AUDIENCE_COUNTS:
+            components.append(
+                html.Span(
+                    id = {'component' : 'Spinner-AudienceSize', 'A_or_B' : A_or_B},
+                    className = "spinner-border spinner-border-sm",
+                    style = {"display" : "none"}
                     )
                 )
-            ),
-         dbc.Row(
+    return components
+
+def filtermenu_layout(project, A_or_B, definition, version, nbytes = False):
+    """
+    Return [card body children, card footer children] of the filter menu of A_or_B, 
+    serialized to plain JSON, so that Dash need not walk the component tree again.
+    
+    Only the layout of Audience A is built from components. The layout of any other 
+    audience is derived from it by rewrite_audience(), since the menus differ only in the
+    A_or_B field of their ids and in their class names.
+    
+    Layouts are memoized in LAYOUT_CACHE, keyed by (project, A_or_B, version), where 
+    version is a hash of definition. Switching back to a project whose definition has not
+    changed then neither re-instantiates nor re-serializes its components.
+    
+    - nbytes: bool, if True (layout, size of the serialized layout) is returned instead.
+    """
+    key = (project, A_or_B, version)
+    entry = LAYOUT_CACHE.lookup(key)
+    if entry is None:
+        if A_or_B == 'A':
+            marks_at = {
+                variable : rangeslider_marks_at(project, variable, radioitem2rangeslidervalues_dict)
+                for variable, radioitem2rangeslidervalues_dict in definition['R'].items()
+                }
+            serialized = to_json_plotly([
+                filtermenu_components(A_or_B, definition, marks_at),
+                filterfooter_components(A_or_B, definition)
+                ])
+            entry = (json.loads(serialized), len(serialized))
+        else:
+            layout_A, nbytes_A = filtermenu_layout(project, 'A', definition, version, nbytes = True)
+            entry = (rewrite_audience(layout_A, A_or_B), nbytes_A)
+        LAYOUT_CACHE.put(key, entry, entry[1])
+    return entry if nbytes else entry[0]
+
+def rewrite_audience(layout, A_or_B):
+    """
+    Return a copy of the serialized layout of the filter menu of Audience A, rewritten
+    for the filter menu of A_or_B: the A_or_B field of every id is set to A_or_B and the
+    class name of Audience A, wherever used as a className or color, to that of A_or_B.
+    """
+    class_name = "text-primary" if A_or_B == "A" else "text-secondary"
+    
+    def rewrite(node):
+        if isinstance(node, dict):
+            rewritten = {}
+            for k, v in node.items():
+                if k == 'A_or_B' and v == 'A':
+                    rewritten[k] = A_or_B
+                elif k in ('className', 'color') and v == "text-primary":
+                    rewritten[k] = class_name
+                else:
+                    rewritten[k] = rewrite(v)
+            return rewritten
+        if isinstance(node, list):
+            return [rewrite(x) for x in node]
+        return node
+    
+    return rewrite(layout)
+
+
+# Bounds for PROJECT_CACHE, measured on the serialized sync dicts and layouts.
+PROJECT_CACHE_MAXSIZE = 16
+PROJECT_CACHE_MAXBYTES = 512 * 2**20
+
+# Projects loaded into PROJECT_CACHE when a worker starts, so that their first selection
+# is served from cache.
+PROJECT_CACHE_WARMUP = []
+
+PROJECT_CACHE = LRUCache(PROJECT_CACHE_MAXSIZE, PROJECT_CACHE_MAXBYTES)
+
+def project_entry(project):
+    """
+    Return everything initiate_a_demo() needs of project, memoized in PROJECT_CACHE:
+        {'definition': project_definition(project),
+         'store_sync_dicts': {variable: sync dict, encoded if COMPACT_DROPDOWN_VALUES},
+         'serialized_sync_dicts': store_sync_dicts as a JSON string,
+         'version': hash of serialized_sync_dicts,
+         'layouts': {'A': filter menu layout, 'B': ...},
+         'store_data': the data of 'Store-ProjectVariableSyncDicts' in SYNC_STORE_MODE,
+         'variable_sync_dict_stores': the StoreVariableSyncDict children of 
+            'Div-VariableSyncDicts', if SYNC_STORE_MODE is 'sliced'}
+    The sync dicts are registered with SYNC_DICT_REGISTRY once per entry, in 'registry' 
+    mode, rather than on every project switch.
+    If AUDIENCE_COUNTS, the AudienceEngine of project is built too, but memoized in 
+    AUDIENCE_ENGINE_CACHE, which bounds it, rather than held by the entry. Not with 
+    BACKGROUND_AUDIENCE_COUNTS, whose jobs build it off the request thread.
+    """
+    entry = PROJECT_CACHE.lookup(project)
+    if entry is not None:
+        return entry
+    
+    definition = project_definition(project)
+    store_sync_dicts = {**definition['D'], **definition['R']}
+    if COMPACT_DROPDOWN_VALUES:
+        store_sync_dicts.update({
+            variable : ProjectSyncDicts.encode_sync_dict(radioitem2dropdownvalues_dict)
+            for variable, radioitem2dropdownvalues_dict in definition['D'].items()
+            })
+    serialized_sync_dicts = json.dumps(store_sync_dicts)
+    version = SyncDictCache.version(serialized_sync_dicts)
+    
+    layouts, nbytes = {}, len(serialized_sync_dicts)
+    for A_or_B in ['A', 'B']:
+        layouts[A_or_B], layout_nbytes = filtermenu_layout(
+            project, A_or_B, definition, version, nbytes = True)
+        nbytes += layout_nbytes
+    
+    if SYNC_STORE_MODE == 'sliced':
+        store_data = None
+        variable_sync_dict_stores = [
+            StoreVariableSyncDict(variable, sync_dict)
+            for variable, sync_dict in store_sync_dicts.items()
+            ]
+        nbytes += sum(store.data['nbytes'] for store in variable_sync_dict_stores)
+    elif SYNC_STORE_MODE == 'registry':
+        store_data = SYNC_DICT_REGISTRY.register(project, store_sync_dicts, serialized_sync_dicts)
+        variable_sync_dict_stores = []
+    else:
+        store_data = serialized_sync_dicts
+        variable_sync_dict_stores = []
+    
+    if AUDIENCE_COUNTS and not BACKGROUND_AUDIENCE_COUNTS:
+        audience_engine(project)
+    
+    entry = {
+        'definition' : definition,
+        'store_sync_dicts' : store_sync_dicts,
+        'serialized_sync_dicts' : serialized_sync_dicts,
+        'version' : version,
+        'layouts' : layouts,
+        'store_data' : store_data,
+        'variable_sync_dict_stores' : variable_sync_dict_stores
+        }
+    PROJECT_CACHE.put(project, entry, nbytes)
+    return entry
+
+def warm_up_project_cache(projects):
+    """Load projects into PROJECT_CACHE, in order, so that the last one is the most recent."""
+    for project in projects:
+        project_entry(project)
+
+@application.route('/cache-stats')
+def cache_stats():
+    """Return the stats() of every cache, to be scraped from /cache-stats."""
+    return {
+        'project' : PROJECT_CACHE.stats(),
+        'sync_dict' : SYNC_DICT_CACHE.stats(),
+        'layout' : LAYOUT_CACHE.stats(),
+        'audience_engine' : AUDIENCE_ENGINE_CACHE.stats()
+        }
+
+@application.route('/metrics')
+def metrics():
+    """
+    Return CALLBACK_METRICS, which are empty unless INSTRUMENT_CALLBACKS, the startup 
+    phases and the stats of every cache, in the Prometheus text exposition format.
+    """
+    lines = ["# TYPE filter_menu_startup_seconds gauge"]
+    for phase, seconds in STARTUP_PHASES.items():
+        lines.append(f'filter_menu_startup_seconds{{phase="{phase}"}} {seconds}')
+    for stat, kind in [('entries', 'gauge'), ('bytes', 'gauge'), ('hits', 'counter'), 
+                       ('misses', 'counter'), ('evictions', 'counter')]:
+        lines.append(f"# TYPE filter_menu_cache_{stat} {kind}")
+        for cache, stats in cache_stats().items():
+            lines.append(f'filter_menu_cache_{stat}{{cache="{cache}"}} {stats[stat]}')
+    
+    return (
+        CALLBACK_METRICS.exposition() + "\n".join(lines) + "\n",
+        200,
+        {'Content-Type' : 'text/plain; version=0.0.4'}
+        )
+
+
+startup_phase('filter menu callbacks')
+
+
+############################################################################### 
+# 4. Layout
+###############################################################################
+
+def app_layout():
+    """Return the layout of the app, built from components."""
+    
+    filter_menus = dbc.Row(
+        [
             dbc.Col(
-                FILTER_MENUS,
+                card_filtermenu('A'), 
+                width = 6
                 ),
-            ),
-        dcc.Store(
-            id = 'Store-ProjectVariableSyncDicts'
-            )
-        ], 
-    fluid = True
-    )
+            dbc.Col(
+                card_filtermenu('B'), 
+                width = 6
+                ),
+            ], 
+        className = "g-0"
+        )
+
+    return dbc.Container(
+        [
+            dbc.Row(
+                dbc.Col(
+                    dcc.Dropdown(
+                        id = 'Dropdown-SelectedProject',
+                        options = [
+                            dict(label=project_name, value=project_name)
+                            for project_name in ['Project 1']
+                            ],
+                        value = 'Project 1',
+                        multi = False,
+                        clearable = False,
+                        )
+                    )
+                ),
+             dbc.Row(
+                dbc.Col(
+                    filter_menus,
+                    ),
+                ),
+            dcc.Store(
+                id = 'Store-ProjectVariableSyncDicts'
+                ),
+            # Audience B's own summaries while 'Not Audience A' is checked
+            dcc.Store(
+                id = 'Store-AudienceBSummaries'
+                ),
+            # selections of both audiences and the deltas that update them, if FILTER_STATE_STORE
+            dcc.Store(
+                id = 'Store-FilterState'
+                ),
+            dcc.Store(
+                id = 'Store-FilterStateDelta'
+                ),
+            # holds a StoreVariableSyncDict per variable if SYNC_STORE_MODE is 'sliced'
+            html.Div(
+                id = 'Div-VariableSyncDicts'
+                )
+            ], 
+        fluid = True
+        )
+
+STARTUP_SNAPSHOT_DATA = load_startup_snapshot(STARTUP_SNAPSHOT)
+if STARTUP_SNAPSHOT_DATA is None:
+    app.layout = app_layout()
+else:
+    app.layout = PrebuiltLayout(STARTUP_SNAPSHOT_DATA['layout'])
+
+startup_phase('layout')
 
 ############################################################################### 
-# 4. For demonstration purposes
+# 5. For demonstration purposes
 ###############################################################################
 
 @callback(
@@ -745,10 +2983,90 @@ app.layout = dbc.Container(
     Output({'component' : 'CardBody-FilterOptions', 'A_or_B' : 'B'}, 'children'),
     Output({'component' : 'CardFooter-FilterSummaries', 'A_or_B' : 'B'}, 'children'),
     Output('Store-ProjectVariableSyncDicts', 'data'),
+    Output('Div-VariableSyncDicts', 'children'),
+    Output('Store-FilterState', 'data'),
+    Output('Store-AudienceBSummaries', 'data'),
+    Output({'component' : 'Checkbox-NotAudienceA', 'A_or_B' : 'B'}, 'value'),
     Input('Dropdown-SelectedProject', 'value')
     )
 def initiate_a_demo(selected_project):
     
+    # A new project starts with 'Not Audience A' unchecked, and without the Audience B
+    # summaries that if_not_audience_A_checked() kept for the previous one. The filter 
+    # state is seeded from the same value, so that it agrees with the checkbox.
+    not_audience_A = False
+    
+    entry = project_entry(selected_project)
+    definition = entry['definition']
+    
+    filtermenu_A_components, filterfooter_A_components = entry['layouts']['A']
+    filtermenu_B_components, filterfooter_B_components = entry['layouts']['B']
+    
+    store_data = entry['store_data']
+    variable_sync_dict_stores = entry['variable_sync_dict_stores']
+
+    return [
+        filtermenu_A_components, 
+        filterfooter_A_components, 
+        filtermenu_B_components,
+        filterfooter_B_components,
+        store_data,
+        variable_sync_dict_stores,
+        filter_state(definition, not_audience_A) if FILTER_STATE_STORE else None,
+        None,
+        not_audience_A
+        ]
+
+
+# Number of respondents in the synthetic table of each project.
+RESPONDENTS_PER_PROJECT = 100_000
+
+def project_respondents(selected_project):
+    """
+    Return the respondent table of selected_project, as AudienceEngine expects: 
+    {variable: column}. With MMAP_PROJECT_DATA, the columns are memory-mapped from 
+    PROJECT_DATA, where they are written on first use.
+    """
+    if not MMAP_PROJECT_DATA:
+        return synthetic_respondents(selected_project)
+    
+    definition = project_definition(selected_project)
+    variables = [*definition['D'], *definition['R']]
+    table = PROJECT_DATA.open(selected_project, variables)
+    if table is None:
+        PROJECT_DATA.write(selected_project, synthetic_respondents(selected_project))
+        table = PROJECT_DATA.open(selected_project, variables)
+    return table
+
+def synthetic_respondents(selected_project):
+    """
+    Return a synthetic respondent table of selected_project, {variable: column}, drawn at 
+    random with a seed derived from selected_project.
+    """
+    definition = project_definition(selected_project)
+    seed = int.from_bytes(
+        hashlib.blake2b(selected_project.encode(), digest_size = 8).digest(), 'little')
+    rng = np.random.default_rng(seed)
+    
+    table = {}
+    for variable, radioitem2dropdownvalues_dict in definition['D'].items():
+        table[variable] = rng.integers(
+            0, len(radioitem2dropdownvalues_dict['All']), RESPONDENTS_PER_PROJECT, 
+            dtype = np.int32)
+    for variable, radioitem2rangeslidervalues_dict in definition['R'].items():
+        x1, x2 = radioitem2rangeslidervalues_dict['All']
+        table[variable] = rng.integers(x1, x2 + 1, RESPONDENTS_PER_PROJECT, dtype = np.int32)
+    return table
+
+
+def project_definition(selected_project):
+    """
+    Return the filter menu definition of selected_project:
+        {'D': {variable: radioitem2dropdownvalues_dict, ...},
+         'R': {variable: radioitem2rangeslidervalues_dict, ...}}
+    Every project of this demo has the same definition.
+    """
+    
     radioitem_options_Market = {
         'All' : ['UK', 'Germany', 'Canada', 'USA', 'India', 'China'],
         'Europe' : ['UK', 'Germany'],
@@ -764,99 +3082,52 @@ def initiate_a_demo(selected_project):
         'Top 25%' : [75, 100]
         }
     
-    store_sync_dicts = {
-        'Market' : radioitem_options_Market,
-        'Age' : radioitem_options_Age
+    return {
+        'D' : {'Market' : radioitem_options_Market},
+        'R' : {'Age' : radioitem_options_Age}
         }
+
+
+def build_startup_snapshot(path, projects):
+    """
+    Write to path the snapshot that load_startup_snapshot() loads: the serialized 
+    app.layout and the filter menu layouts of projects, tagged with source_version().
+    """
+    filtermenu_layouts = []
+    for project in projects:
+        entry = project_entry(project)
+        for A_or_B in ['A', 'B']:
+            layout, nbytes = filtermenu_layout(
+                project, A_or_B, entry['definition'], entry['version'], nbytes = True)
+            filtermenu_layouts.append([project, A_or_B, entry['version'], layout, nbytes])
     
-    filtermenu_A_components = [
-        FormWithRadioitemsAndDropdown(
-            'A',
-            'Market',
-            radioitem_options_Market
-            ),
-        FormWithRadioitemsAndRangeslider(
-            'A',
-            'Age',
-            radioitem_options_Age
-            )
-        ]
-    
-    filtermenu_B_components = [
-        FormWithRadioitemsAndDropdown(
-            'B',
-            'Market',
-            radioitem_options_Market
-            ),
-        FormWithRadioitemsAndRangeslider(
-            'B',
-            'Age',
-            radioitem_options_Age
-            )
-        ]
-          
-    filterfooter_A_components = [
-        MarkdownInFilterFooter(
-            'A',
-            'D',
-            'Market',
-            'name'
-            ),
-        MarkdownInFilterFooter(
-            'A',
-            'D',
-            'Market',
-            'value'
-            )    ,
-        MarkdownInFilterFooter(
-            'A',
-            'R',
-            'Age',
-            'name'
-            ),
-        MarkdownInFilterFooter(
-            'A',
-            'R',
-            'Age',
-            'value'
-            )      
-        ]
-    
-    filterfooter_B_components = [
-        MarkdownInFilterFooter(
-            'B',
-            'D',
-            'Market',
-            'name'
-            ),
-        MarkdownInFilterFooter(
-            'B',
-            'D',
-            'Market',
-            'value'
-            )    ,
-        MarkdownInFilterFooter(
-            'B',
-            'R',
-            'Age',
-            'name'
-            ),
-        MarkdownInFilterFooter(
-            'B',
-            'R',
-            'Age',
-            'value'
-            )      
-        ]
+    snapshot = {
+        'source' : source_version(),
+        'layout' : json.loads(to_json_plotly(app_layout())),
+        'filtermenu_layouts' : filtermenu_layouts
+        }
+    atomic_write(path, json.dumps(snapshot))
 
-    return [
-        filtermenu_A_components, 
-        filterfooter_A_components, 
-        filtermenu_B_components,
-        filterfooter_B_components,
-        json.dumps(store_sync_dicts)
-        ]
+
+warm_up_project_cache(PROJECT_CACHE_WARMUP)
+
+startup_phase('project cache warm-up')
 
 
 if __name__ == "__main__":
-    app.run_server(debug = True, use_reloader = False)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build-snapshot', metavar = 'PATH',
+                        help = "write a startup snapshot to PATH, for STARTUP_SNAPSHOT, and exit")
+    parser.add_argument('--projects', nargs = '*', default = ['Project 1'],
+                        help = "projects whose filter menus the snapshot holds")
+    parser.add_argument('--startup-report', action = 'store_true',
+                        help = "print the time spent in each phase of the import, and exit")
+    args = parser.parse_args()
+    
+    if args.build_snapshot:
+        build_startup_snapshot(args.build_snapshot, args.projects)
+    elif args.startup_report:
+        print(startup_report())
+    else:
+        app.run_server(debug = True, use_reloader = False)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+pytest.importorskip('dash')
+pytest.importorskip('dash_bootstrap_components')
+
+import loadtest
+
+
+def form_id(subcomponent, A_or_B, variable):
+    return {'component' : 'FormWithRadioitemsAndDropdown', 'subcomponent' : subcomponent,
+            'A_or_B' : A_or_B, 'variable' : variable}
+
+
+def markdown_id(A_or_B, variable):
+    return {'component' : 'Markdown-Value', 'A_or_B' : A_or_B, 'var_type' : 'D',
+            'variable' : variable}
+
+
+def dependency_id(id_):
+    return loadtest.stringify_id(id_)
+
+
+# sync_radioitems_and_dropdown() and markdown_children_update(), as in /_dash-dependencies
+SYNC = {
+    'output' : '..' + '...'.join([
+        dependency_id(form_id('dropdown', ['MATCH'], ['MATCH'])) + '.value',
+        dependency_id(form_id('radioitems', ['MATCH'], ['MATCH'])) + '.value'
+        ]) + '..',
+    'inputs' : [
+        {'id' : dependency_id(form_id('radioitems', ['MATCH'], ['MATCH'])), 'property' : 'value'},
+        {'id' : dependency_id(form_id('dropdown', ['MATCH'], ['MATCH'])), 'property' : 'value'}
+        ]
+    }
+MARKDOWN = {
+    'output' : '..' + '...'.join([
+        dependency_id(markdown_id('A', ['MATCH'])) + '.children',
+        dependency_id(markdown_id('B', ['MATCH'])) + '.children'
+        ]) + '..',
+    'inputs' : [
+        {'id' : dependency_id(form_id('dropdown', ['ALL'], ['MATCH'])), 'property' : 'value'}
+        ]
+    }
+
+
+class FakeBrowser(loadtest.Browser):
+
+    def __init__(self, callbacks, stats, layout):
+        self.callbacks = callbacks
+        self.stats = stats
+        self.components = {}
+        self.ids = {}
+        self.register(layout)
+
+    def request(self, method, path, body = None):
+        # the sync callback rewrites both values, the markdown callback its children
+        if body['output'] == SYNC['output']:
+            dropdown, radioitems = body['outputs']
+            response = {
+                loadtest.stringify_id(dropdown['id']) : {'value' : ['Europe']},
+                loadtest.stringify_id(radioitems['id']) : {'value' : 'Preset'}
+                }
+        else:
+            response = {
+                loadtest.stringify_id(output['id']) : {'children' : 'Europe'}
+                for output in body['outputs']
+                }
+        return 200, {'response' : response}, 0.0
+
+
+def test_preset_click_sends_one_request_per_callback():
+    layout = [
+        {'type' : 'Div', 'props' : {'id' : id_, 'value' : None}}
+        for A_or_B in ['A', 'B']
+        for id_ in [form_id('radioitems', A_or_B, 'Region'), form_id('dropdown', A_or_B, 'Region')]
+        ] + [
+        {'type' : 'Div', 'props' : {'id' : markdown_id(A_or_B, 'Region'), 'children' : 'All'}}
+        for A_or_B in ['A', 'B']
+        ]
+    stats = loadtest.Stats()
+    callbacks = [loadtest.Callback(SYNC, 'sync'), loadtest.Callback(MARKDOWN, 'markdown')]
+    browser = FakeBrowser(callbacks, stats, json.loads(json.dumps(layout)))
+
+    browser.interact({
+        'name' : 'preset click',
+        'changes' : [{'id' : form_id('radioitems', 'A', 'Region'), 'property' : 'value',
+                      'value' : 'Preset'}]
+        })
+
+    assert len(stats.seconds['sync']) == 1
+    assert len(stats.seconds['markdown']) == 1